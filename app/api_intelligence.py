@@ -1,9 +1,69 @@
-from fastapi import APIRouter
-from intelligence.query_engine import ask
+from datetime import date
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Query
+from pydantic import BaseModel, Field
+
+from intelligence.query_engine import QueryEngine
+from intelligence.vector_store import get_db
 
 router = APIRouter(prefix="/intelligence", tags=["intelligence"])
 
+
+class BatchQuestion(BaseModel):
+    q: str
+    top_k: int = Field(5, ge=1, le=50)
+
+
+class SearchFilters(BaseModel):
+    client_id: Optional[str] = None
+    source: Optional[str] = None
+    advisor: Optional[str] = None
+    firm: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[BatchQuestion] = Field(..., max_length=100)
+    aggregate: Literal["max", "sum"] = "max"
+    filters: Optional[SearchFilters] = None
+    rerank: Optional[bool] = None
+
+
 @router.get("/ask")
-def ask_query(q: str):
-    results = ask(q)
-    return {"question": q, "results": results}
+def ask_query(
+    q: str,
+    top_k: int = Query(5, ge=1, le=50),
+    aggregate: Literal["max", "sum"] = "max",
+    client_id: Optional[str] = None,
+    source: Optional[str] = None,
+    advisor: Optional[str] = None,
+    firm: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    rerank: Optional[bool] = None,
+):
+    filters = SearchFilters(
+        client_id=client_id, source=source, advisor=advisor,
+        firm=firm, date_from=date_from, date_to=date_to,
+    )
+    engine = QueryEngine(get_db())
+    return engine.ask(q, top_k=top_k, aggregate=aggregate, filters=filters.model_dump(), rerank=rerank)
+
+
+@router.post("/ask_batch")
+def ask_batch(body: AskBatchRequest):
+    engine = QueryEngine(get_db())
+    answers = engine.ask_batch(
+        [(item.q, item.top_k) for item in body.questions],
+        aggregate=body.aggregate,
+        filters=body.filters.model_dump() if body.filters else None,
+        rerank=body.rerank,
+    )
+    return {
+        "answers": [
+            {"question": item.q, **answer}
+            for item, answer in zip(body.questions, answers)
+        ]
+    }
@@ -1,24 +1,33 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
-import shutil
+from itertools import islice
+import asyncio
 import json
+import shutil
+from typing import Optional
 from fastapi.staticfiles import StaticFiles
 
-from chaser.state_machine import get_next_state
+from chaser.dispatch import advance_book, dispatch_chases
+from chaser.forecast import DEFAULT_DAYS, MAX_DAYS, forecast
+from chaser.run_doc_chaser import annotate_next_states
+from core.change_feed import ChangeLog
+from core.client_summary import ClientSummaries
+from core.constants import ChaseStatus
+from core.generations import SNAPSHOT_NAME, TASKS_NAME, UPDATED_NAME, GenerationStore
+from core.task_table import TaskTable
 
+from ingestion.dedupe import dedupe_docs
 from ingestion.docx_reader import load_source_docs
-from ingestion.build_tasks_from_docs import make_client_id, sane_anchor_date
-from ingestion.extractor import (
-    guess_client_name,
-    find_any_date,
-    parse_date_hint,
-    extract_presence,
-    build_tasks,
-)
+from ingestion.build_tasks_from_docs import extract_document, publish_book
+from ingestion.extraction_store import ExtractionStore
+from ingestion.snapshot import file_stamp, load_snapshot
 
-from intelligence.query_engine import QueryEngine
-from intelligence.vector_store import get_db
+from app.api_intelligence import router as intelligence_router
+from intelligence.index_builder import document_records
+from intelligence.reranker import RERANK_ENABLED, get_reranker
+from intelligence.vector_store import add_texts, get_index
 
 
 app = FastAPI()
@@ -36,14 +45,17 @@ app.add_middleware(
 )
 
 SOURCE_DIR = Path("data/source_docs")
-EXTRACTED_DIR = Path("data/extracted")
+EXTRACTED_STORE = Path("data/extracted.store")
 
 
+GENERATIONS = GenerationStore(Path("data/generations"))
+# read only until the first /run commits a generation
 TASKS_FILE = Path("data/doc_tasks.json")
 TASKS_FALLBACK_FILE = Path("data/doc_tasks_updated.json")
+CHANGE_LOG = ChangeLog(Path("data/task_changes.jsonl"))
+CLIENT_SUMMARIES = ClientSummaries()
 
 SOURCE_DIR.mkdir(parents=True, exist_ok=True)
-EXTRACTED_DIR.mkdir(parents=True, exist_ok=True)
 
 
 
@@ -56,6 +68,9 @@ def preload_embeddings():
     Strategy:
     - load all docs from data/source_docs
     - add each doc to vector DB if not already present
+
+    Re-indexing a running deployment is `python -m intelligence.index_builder
+    rebuild`, which swaps in a new index without touching the live one.
     """
     try:
         docs = load_source_docs(str(SOURCE_DIR))
@@ -63,12 +78,11 @@ def preload_embeddings():
             print("[startup] No source docs found. Skipping embeddings preload.")
             return
 
-        db = get_db()
+        index = get_index()
 
-        
         already_has_data = False
         try:
-            already_has_data = (db._collection.count() > 0)  
+            already_has_data = index.count() > 0
         except Exception:
             already_has_data = False
 
@@ -76,41 +90,18 @@ def preload_embeddings():
             print("[startup] Vector store already has data. Skipping preload.")
             return
 
-        
-        texts = []
-        metadatas = []
-        ids = []
-
-        for d in docs:
-            text = d.get("text", "")
-            file_name = d.get("file_name", "unknown.docx")
-            if not text.strip():
-                continue
-
-            client_id = make_client_id(file_name)
-            client_name = guess_client_name(text) or file_name.replace(".docx", "")
-
-            texts.append(text)
-            metadatas.append(
-                {
-                    "client_id": client_id,
-                    "client_name": client_name,
-                    "source": file_name,
-                }
-            )
-            ids.append(client_id)
+        records = document_records(docs)
+        ids = [r[0] for r in records]
+        texts = [r[1] for r in records]
+        metadatas = [r[2] for r in records]
 
         if not texts:
             print("[startup] No valid text to embed. Skipping preload.")
             return
 
-        # Chroma style add
-        # If your get_db() returns a wrapper, adjust accordingly.
-        try:
-            db.add_documents(texts=texts, metadatas=metadatas, ids=ids)
-        except Exception:
-            # fallback: if db is a raw chroma collection
-            db.add(documents=texts, metadatas=metadatas, ids=ids)
+        # goes through the shared embedding service when one is configured,
+        # so several workers starting at once don't each write the index
+        add_texts(ids, texts, metadatas)
 
         print(f"[startup] Preloaded {len(texts)} docs into vector store ✅")
 
@@ -137,88 +128,214 @@ async def upload(files: list[UploadFile] = File(...)):
 
 @app.post("/run")
 def run():
-    docs = load_source_docs(str(SOURCE_DIR))
-    all_tasks = []
+    docs, duplicates = dedupe_docs(load_source_docs(str(SOURCE_DIR)))
+    all_extracted = [extract_document(d) for d in docs]
+
+    ExtractionStore(EXTRACTED_STORE).write_batch(all_extracted)
+    # chases already sent stay sent in the rebuilt book, and the change feed
+    # follows the annotated book, the same one chaser passes log
+    table, _ = publish_book(GENERATIONS, all_extracted, log=CHANGE_LOG, fallback=_annotated_legacy_book)
+    CLIENT_SUMMARIES.sync(CHANGE_LOG, load_task_table)
+    return {"tasks_count": len(table), "duplicates": duplicates}
+
+
+def _annotated_legacy_book():
+    previous = load_task_table()
+    return annotate_next_states(previous) if previous is not None else None
+
+
+_table_cache = {}
+
+
+def _task_sources():
+    """(cache key, tasks file, snapshot file or None) for the current book, or None."""
+    gen = GENERATIONS.current()
+    if gen is not None:
+        # a committed generation never changes, so its number is the cache key
+        for name in (TASKS_NAME, UPDATED_NAME):
+            if gen.has(name):
+                return ("generation", gen.number, name), gen.path(name), gen.path(SNAPSHOT_NAME)
+        return None
+
+    # stable demo fallback
+    for path in (TASKS_FILE, TASKS_FALLBACK_FILE):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        return (str(path), st.st_mtime_ns, st.st_size), path, None
+    return None
+
+
+def load_task_table():
+    """
+    Current task book as a TaskTable, or None if nothing has been generated.
+    The current generation is resolved once per call and parsed once per
+    generation, shared by every request; its binary snapshot is mapped
+    instead of the JSON when it matches the file.
+    """
+    sources = _task_sources()
+    if sources is None:
+        return None
+    stamp, path, snapshot_path = sources
+    if _table_cache.get("stamp") != stamp:
+        snapshot = None
+        if snapshot_path is not None:
+            snapshot = load_snapshot(snapshot_path, source=file_stamp(path))
+        if snapshot is not None:
+            _table_cache["table"] = snapshot.table
+        else:
+            _table_cache["table"] = TaskTable.from_json(path.read_text(encoding="utf-8"))
+        _table_cache["stamp"] = stamp
+    return _table_cache["table"]
+
+
+@app.on_event("startup")
+def warm_reranker():
+    """Start loading the cross-encoder now rather than on the first reranked question."""
+    if RERANK_ENABLED:
+        get_reranker().load_in_background()
 
-    for d in docs:
-        text = d["text"]
-        file_name = d["file_name"]
 
-        client_id = make_client_id(file_name)
-        client_name = guess_client_name(text) or file_name.replace(".docx", "")
+@app.on_event("startup")
+def warm_task_table():
+    """Map the /run snapshot (or parse the tasks JSON) before the first request."""
+    load_task_table()
 
-        date_hint = find_any_date(text)
-        anchor = sane_anchor_date(parse_date_hint(date_hint))
 
-        presence = extract_presence(text)
+NDJSON = "application/x-ndjson"
+NDJSON_BATCH = 256
 
-        extracted = {
-            "client_id": client_id,
-            "client_name": client_name,
-            "source_file": file_name,
-            "date_hint": date_hint,
-            "anchor_date": anchor.date().isoformat() if anchor else None,
-            "presence": presence,
-        }
 
-        (EXTRACTED_DIR / f"{client_id}.json").write_text(
-            json.dumps(extracted, indent=2), encoding="utf-8"
-        )
+def wants_ndjson(request: Request, stream: bool) -> bool:
+    """Streaming is opt-in: ?stream=true or an Accept header asking for NDJSON."""
+    return stream or NDJSON in request.headers.get("accept", "")
 
-        tasks = build_tasks(client_id, client_name, file_name, presence, anchor)
-        all_tasks.extend(tasks)
 
-    TASKS_FILE.write_text(json.dumps(all_tasks, indent=2), encoding="utf-8")
-    return {"tasks_count": len(all_tasks)}
+def ndjson_lines(records):
+    """One compact JSON document per line, written out NDJSON_BATCH lines at a time."""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, NDJSON_BATCH))
+        if not batch:
+            return
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
 
 
 @app.get("/tasks")
-def tasks():
-    # stable demo fallback
-    if TASKS_FILE.exists():
-        return {"tasks": json.loads(TASKS_FILE.read_text(encoding="utf-8"))}
-    if TASKS_FALLBACK_FILE.exists():
-        return {"tasks": json.loads(TASKS_FALLBACK_FILE.read_text(encoding="utf-8"))}
-    return {"tasks": []}
+def tasks(request: Request, stream: bool = False):
+    table = load_task_table()
+    if wants_ndjson(request, stream):
+        return StreamingResponse(ndjson_lines(table if table is not None else ()), media_type=NDJSON)
+
+    body = table.to_json() if table is not None else "[]"
+    return Response(content='{"tasks":' + body + "}", media_type="application/json")
+
+
+@app.get("/tasks/changes")
+async def task_changes(
+    since: int = 0,
+    timeout: float = Query(25.0, ge=0, le=60),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """
+    Task changes after cursor `since` (see core.change_feed). Waits up to
+    `timeout` seconds for one if there are none yet. Pass the returned cursor
+    as the next `since`; on "reset": true refetch /tasks and continue from the
+    returned cursor.
+    """
+    return await CHANGE_LOG.wait(since, timeout, limit)
+
+
+@app.get("/tasks/changes/stream")
+async def task_changes_stream(request: Request, since: Optional[int] = None):
+    """The same changes as Server-Sent Events; resumes from Last-Event-ID."""
+    last_id = request.headers.get("last-event-id")
+    cursor = int(last_id) if last_id and last_id.isdigit() else since
+    if cursor is None:
+        cursor = CHANGE_LOG.cursor
+
+    async def events():
+        nonlocal cursor
+        while not await request.is_disconnected():
+            out = await CHANGE_LOG.wait(cursor, timeout=15.0)
+            if out["reset"]:
+                yield f"id: {out['cursor']}\nevent: reset\ndata: {{}}\n\n"
+            elif not out["changes"]:
+                yield ": keep-alive\n\n"
+            for c in out["changes"]:
+                yield f"id: {c['seq']}\nevent: {c['op']}\ndata: {json.dumps(c, ensure_ascii=False)}\n\n"
+            cursor = out["cursor"]
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def chaser_groups(table: TaskTable):
+    """{"client", "tasks"} per client, built one client at a time."""
+    table = annotate_next_states(table)
+
+    for client, view in table.group_by("client_name").items():
+        items = []
+        for t in view:
+            cur = ChaseStatus(t["status"] or ChaseStatus.NOT_STARTED)
+            items.append(
+                {
+                    "item": t["item_name"],
+                    "state": f"{cur.name} -> {t['next_state']}",
+                    "due_date": t["due_date"],
+                    "action": t["reason"],
+                    "source": t["source_doc"],
+                    "target": t["target"],
+                    "priority": t["priority"],
+                    "required_for": t["required_for"],
+                }
+            )
+        yield {"client": client or "Unknown", "tasks": items}
 
 
 @app.get("/chaser/tasks")
-def chaser_tasks():
-    # stable demo fallback
-    if TASKS_FILE.exists():
-        tasks_list = json.loads(TASKS_FILE.read_text(encoding="utf-8"))
-    elif TASKS_FALLBACK_FILE.exists():
-        tasks_list = json.loads(TASKS_FALLBACK_FILE.read_text(encoding="utf-8"))
-    else:
+def chaser_tasks(request: Request, stream: bool = False):
+    table = load_task_table()
+    if wants_ndjson(request, stream):
+        groups = chaser_groups(table) if table is not None else ()
+        return StreamingResponse(ndjson_lines(groups), media_type=NDJSON)
+
+    if table is None:
         return []
+    return list(chaser_groups(table))
 
-    grouped = {}
-    for t in tasks_list:
-        client = t.get("client_name", "Unknown")
-        grouped.setdefault(client, [])
 
-        cur = t.get("status", "NOT_STARTED")
-        due = t.get("due_date")
-        nxt = get_next_state({"status": cur, "due_date": due})
+@app.get("/chaser/summary")
+def chaser_summary(client_id: Optional[str] = None):
+    """
+    One rollup per client (see core.client_summary), maintained from the
+    change feed rather than recomputed from the task list.
+    """
+    CLIENT_SUMMARIES.sync(CHANGE_LOG, load_task_table)
+    if client_id is not None:
+        row = CLIENT_SUMMARIES.get(client_id)
+        return {"clients": [row] if row is not None else []}
+    return {"clients": CLIENT_SUMMARIES.rows()}
 
-        grouped[client].append(
-            {
-                "item": t.get("item_name"),
-                "state": f"{cur} -> {nxt}",
-                "due_date": due,
-                "action": t.get("reason"),
-                "source": t.get("source_doc"),
-                "target": t.get("target"),
-                "priority": t.get("priority"),
-                "required_for": t.get("required_for"),
-            }
-        )
 
-    out = []
-    for client, items in grouped.items():
-        out.append({"client": client, "tasks": items})
+@app.get("/chaser/forecast")
+def chaser_forecast(days: int = Query(DEFAULT_DAYS, ge=1, le=MAX_DAYS)):
+    """Reminders and escalations expected per day over the next `days` days (see chaser.forecast)."""
+    table = load_task_table()
+    return forecast(table if table is not None else TaskTable.from_dicts([]), days)
 
-    return out
+
+@app.post("/chaser/dispatch")
+async def chaser_dispatch(dry_run: bool = False):
+    """Send reminder/escalation messages for the current book (see chaser.dispatch)."""
+    table = load_task_table()
+    if table is None:
+        return {"messages": []}
+    results = await dispatch_chases(table, dry_run=dry_run)
+    if any(r["status"] == "sent" for r in results):
+        # statuses move on in a new generation, so the next call sends nothing twice
+        await asyncio.to_thread(advance_book, GENERATIONS, log=CHANGE_LOG)
+    return {"messages": results}
 
 
 @app.post("/chaser/run")
@@ -227,12 +344,7 @@ def chaser_run():
     return {"ok": True}
 
 
-@app.get("/intelligence/ask")
-def intelligence_ask(q: str):
-    db = get_db()
-    engine = QueryEngine(db)
-    return engine.ask(q)
-
+app.include_router(intelligence_router)
 
 
 UI_DIST = Path(__file__).resolve().parents[1] / "ui" / "dist"
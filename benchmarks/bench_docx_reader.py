@@ -0,0 +1,80 @@
+"""
+Parse throughput and peak memory: streaming reader vs python-docx.
+
+    python -m benchmarks.bench_docx_reader [folder] [--repeat N]
+
+Each reader runs in its own subprocess so peak RSS is not polluted by the other.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+READERS = {
+    "streaming": "read_docx_text",
+    "python-docx": "read_docx_text_python_docx",
+}
+
+
+def run_reader(reader: str, folder: str, repeat: int) -> dict:
+    import resource
+    from ingestion import docx_reader
+
+    fn = getattr(docx_reader, READERS[reader])
+    files = sorted(Path(folder).glob("*.docx"))
+    total_bytes = sum(fp.stat().st_size for fp in files)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    chars = 0
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for fp in files:
+            chars += len(fn(str(fp)))
+    elapsed = time.perf_counter() - t0
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        "reader": reader,
+        "files": len(files) * repeat,
+        "seconds": elapsed,
+        "mb_per_s": (total_bytes * repeat / 1e6) / elapsed if elapsed else 0.0,
+        "docs_per_s": (len(files) * repeat) / elapsed if elapsed else 0.0,
+        "chars": chars // repeat,
+        "py_peak_mb": py_peak / 1e6,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", nargs="?", default="data/source_docs")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", choices=sorted(READERS))
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_reader(args.child, args.folder, args.repeat)))
+        return
+
+    print(f"{'reader':<12} {'docs/s':>9} {'MB/s':>9} {'py peak MB':>11} {'RSS +MB':>9} {'chars':>9}")
+    for reader in READERS:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_docx_reader", args.folder,
+             "--repeat", str(args.repeat), "--child", reader],
+            check=True, capture_output=True, text=True,
+        )
+        r = json.loads(out.stdout)
+        print(
+            f"{r['reader']:<12} {r['docs_per_s']:>9.1f} {r['mb_per_s']:>9.1f} "
+            f"{r['py_peak_mb']:>11.2f} {r['rss_growth_mb']:>9.1f} {r['chars']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
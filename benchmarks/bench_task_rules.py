@@ -0,0 +1,89 @@
+"""
+Whole-book task generation, timed along the path /run takes.
+
+    python -m benchmarks.bench_task_rules [--clients 100000] [--budget 10.0]
+
+Builds random extraction records (presence dicts and packed presence_bits,
+as extract_document returns them) and times build_task_table on them: the
+flag matrix, rule evaluation, TaskTable construction and the column-wise
+schema validation. That generation step is what the budget (default 1s for
+100k clients) applies to. Writing doc_tasks.json (to_json) is timed on its
+own, with a separate budget.
+"""
+import argparse
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+from ingestion.extractor import bits_to_presence
+from ingestion.task_rules import build_task_table, default_rules, extraction_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--budget", type=float, default=1.0, help="max seconds for build + validate")
+    parser.add_argument("--json-budget", type=float, default=5.0, help="max seconds for to_json")
+    args = parser.parse_args()
+
+    rules = default_rules()
+    rng = np.random.default_rng(0)
+    n = args.clients
+
+    bits = (rng.random((n, len(rules.flags))) < 0.7) @ (1 << np.arange(len(rules.flags)))
+    anchors = date(2025, 1, 1).toordinal() + rng.integers(0, 365, n)
+    extractions = [
+        {
+            "client_id": f"DOC_{i:06d}",
+            "client_name": f"Client {i}",
+            "source_file": f"client_{i}.docx",
+            "anchor_date": date.fromordinal(int(anchors[i])).isoformat(),
+            "presence": bits_to_presence(int(bits[i]), rules.flags),
+            "presence_bits": int(bits[i]),
+        }
+        for i in range(n)
+    ]
+
+    t0 = time.perf_counter()
+    matrix = extraction_matrix(extractions, rules.flags)
+    t_matrix = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    hits = rules.evaluate(matrix)
+    t_eval = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    build_task_table(extractions, rules, validate=False)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    table = build_task_table(extractions, rules)
+    t_validated = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    body = table.to_json(indent=2)
+    t_json = time.perf_counter() - t0
+
+    print(f"{n:,} clients x {len(rules)} rules -> {len(table):,} tasks ({int(hits.sum()):,} hits)")
+    print(f"presence matrix    : {t_matrix:.3f}s")
+    print(f"evaluate           : {t_eval:.3f}s")
+    print(f"build table        : {t_build:.3f}s  ({table.nbytes() / 1e6:.1f} MB of columns)")
+    print(f"build + validate   : {t_validated:.3f}s")
+    print(f"to_json            : {t_json:.3f}s  ({len(body) / 1e6:.1f} MB)")
+
+    failed = False
+    if t_validated > args.budget:
+        print(f"FAIL: build + validate took {t_validated:.3f}s, budget {args.budget:.3f}s")
+        failed = True
+    if t_json > args.json_budget:
+        print(f"FAIL: to_json took {t_json:.3f}s, budget {args.json_budget:.3f}s")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f"OK: generation within {args.budget:.3f}s, to_json within {args.json_budget:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
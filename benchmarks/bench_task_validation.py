@@ -0,0 +1,88 @@
+"""
+Bulk task validation through core.schemas.CHASE_TASKS.
+
+    python -m benchmarks.bench_task_validation [--tasks 1000000] [--budget 4.0]
+
+Validates and serialises a synthetic book of build_tasks-shaped dicts in one
+adapter call each, and compares against constructing a ChaseItem per task on
+a sample. Exits non-zero if bulk validation exceeds the budget (seconds).
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from core.schemas import ChaseItem, dump_tasks_json, gc_paused, parse_tasks_json, validate_tasks
+from ingestion.extractor import build_tasks
+
+SAMPLE_PRESENCE = {
+    "pre_meeting": {"personal_details": False, "income_employment_tax": True, "objectives_priorities": True,
+                    "risk_profile": False, "vulnerabilities": False},
+    "pensions": {"current_valuation": False, "fund_breakdown": True, "contribution_history": True,
+                 "transfer_value": False, "exit_penalties": True, "transfer_restrictions": True,
+                 "scheme_type": True, "guaranteed_benefits": True},
+    "loa": False,
+    "policy_number_present": False,
+    "mentions_pension": True,
+    "mentions_provider": True,
+    "mentions_children": True,
+    "mentions_education": False,
+    "mentions_isa": True,
+    "isa_remaining_mentioned": False,
+}
+
+
+def synthetic_tasks(n: int) -> list:
+    anchor = datetime(2025, 1, 1)
+    per_client = build_tasks("DOC_0000", "Client 0", "client_0.docx", SAMPLE_PRESENCE, anchor)
+    tasks = []
+    i = 0
+    while len(tasks) < n:
+        cid = f"DOC_{i:06d}"
+        due_shift = timedelta(days=i % 90)
+        for t in per_client:
+            due = (datetime.fromisoformat(t["due_date"]) + due_shift).date().isoformat()
+            tasks.append({**t, "client_id": cid, "client_name": f"Client {i}",
+                          "source_doc": f"client_{i}.docx", "due_date": due})
+        i += 1
+    return tasks[:n]
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--budget", type=float, default=4.0, help="max seconds for bulk validation")
+    parser.add_argument("--sample", type=int, default=50_000, help="per-object comparison sample")
+    args = parser.parse_args()
+
+    tasks = synthetic_tasks(args.tasks)
+    print(f"{len(tasks):,} tasks")
+
+    with gc_paused():
+        validated, t_validate = timed(validate_tasks, tasks)
+        payload, t_dump = timed(dump_tasks_json, validated)
+        _, t_parse = timed(parse_tasks_json, payload)
+
+    sample = tasks[: args.sample]
+    _, t_models = timed(lambda rows: [ChaseItem(**r) for r in rows], sample)
+    per_object_projected = t_models * len(tasks) / max(len(sample), 1)
+
+    print(f"bulk validate_python : {t_validate:7.3f}s")
+    print(f"bulk dump_json       : {t_dump:7.3f}s  ({len(payload) / 1e6:.0f} MB)")
+    print(f"bulk validate_json   : {t_parse:7.3f}s")
+    print(f"per-object ChaseItem : {per_object_projected:7.3f}s  (projected from {len(sample):,})")
+
+    if t_validate > args.budget:
+        print(f"FAIL: bulk validation took {t_validate:.3f}s, budget {args.budget:.3f}s")
+        sys.exit(1)
+    print(f"OK: within {args.budget:.3f}s budget")
+
+
+if __name__ == "__main__":
+    main()
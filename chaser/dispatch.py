@@ -0,0 +1,611 @@
+"""
+Outbound chase dispatch.
+
+Tasks whose next state is REMINDER_SENT or ESCALATED become real messages:
+
+1. coalesce() groups them into one message per recipient per channel. A
+   recipient is a client, the advisor, or a provider: provider tasks carry
+   the provider their document names (see task_rules), and all of them for
+   one provider go out as one email, whichever clients they are for.
+   Provider tasks whose document names none are grouped per client.
+2. Dispatcher sends the messages concurrently with asyncio through one
+   adapter per channel. Each adapter has its own token-bucket rate limit and
+   concurrency cap, and failed sends are retried with exponential backoff,
+   except failures the adapter reports as permanent (SMTP 5xx).
+3. Sent chases are recorded in a SentLedger (data/chase_sent.json). A task
+   whose status already shows its chase as sent (follow_up_sent for a
+   reminder, escalated for an escalation) is not sent again, and
+   advance_book() commits a generation with those statuses so /tasks and the
+   change feed show them. /run applies the ledger to the books it rebuilds.
+
+Adapters:
+    SmtpAdapter       email over SMTP (point it at a local sink such as
+                      `python -m aiosmtpd -n -l localhost:1025` to try it out)
+    DashboardAdapter  appends notifications to a JSONL feed for the UI
+    SmsAdapter        stub that records what it would have sent
+
+Addresses come from a ContactBook (data/contacts.json):
+
+    {"client":   {"<client_id>": {"email": ..., "sms": ...}},
+     "provider": {"<provider name>": {"email": ...},
+                  "<client_id>": {"email": ...}},   # for tasks naming no provider
+     "advisor":  {"email": ..., "dashboard": "advisers"}}
+
+    python -m chaser.dispatch [--dry-run]
+"""
+import asyncio
+import fcntl
+import json
+import os
+import queue
+import smtplib
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from chaser.run_doc_chaser import annotate_next_states, feed_book
+from core.constants import ChaseStatus, ChaseTarget
+from core.generations import TASKS_NAME, UPDATED_NAME, StaleGenerationError
+from core.task_table import TaskTable
+
+DISPATCH_STATES = ("REMINDER_SENT", "ESCALATED")
+CONTACTS_PATH = Path(os.getenv("ADVISOR_CONTACTS", "data/contacts.json"))
+DASHBOARD_FEED = Path("data/dashboard_notifications.jsonl")
+SENT_LEDGER = Path("data/chase_sent.json")
+LEDGER_POLL = 0.05      # seconds between tries for a ledger lock held elsewhere
+
+# one message per (channel, target, client, provider); a named provider's
+# tasks are grouped without the client (see coalesce)
+COALESCE_KEYS = ("channel", "target", "client_id", "provider")
+
+# status a task moves to once the chase for its next state has been sent
+SENT_STATUS = {"REMINDER_SENT": ChaseStatus.FOLLOW_UP_SENT, "ESCALATED": ChaseStatus.ESCALATED}
+# statuses in the order a chase moves through them
+STATUS_ORDER = (
+    ChaseStatus.NOT_STARTED,
+    ChaseStatus.REQUESTED,
+    ChaseStatus.FOLLOW_UP_SENT,
+    ChaseStatus.ESCALATED,
+    ChaseStatus.RECEIVED,
+    ChaseStatus.COMPLETED,
+)
+_RANK = {s: i for i, s in enumerate(STATUS_ORDER)}
+
+
+def already_chased(status: Optional[str], next_state: Optional[str]) -> bool:
+    """True if `status` shows the chase for `next_state` as sent (or no longer needed)."""
+    sent = SENT_STATUS.get(next_state or "")
+    if sent is None or not status:
+        return False
+    return _RANK[ChaseStatus(status)] >= _RANK[sent]
+
+
+class ChaseMessage:
+    __slots__ = ("channel", "target", "client_id", "client_name", "client_ids", "provider",
+                 "tasks", "escalated", "recipient")
+
+    def __init__(self, channel, target, client_id, client_name, provider, tasks):
+        self.channel = channel
+        self.target = target
+        self.client_ids = list(dict.fromkeys(t["client_id"] for t in tasks))
+        # a provider message can cover several clients; then it is for none in particular
+        single = len(self.client_ids) == 1
+        self.client_id = client_id if single else None
+        self.client_name = client_name if single else None
+        self.provider = provider
+        self.tasks = tasks
+        self.escalated = any(t["next_state"] == "ESCALATED" for t in tasks)
+        self.recipient = None
+
+    @property
+    def subject(self) -> str:
+        prefix = "URGENT: " if self.escalated else "Reminder: "
+        about = f" ({self.provider.title()})" if self.provider else ""
+        if len(self.client_ids) > 1:
+            return f"{prefix}outstanding information for {len(self.client_ids)} clients{about}"
+        return f"{prefix}outstanding information for {self.client_name or self.client_id}{about}"
+
+    @property
+    def body(self) -> str:
+        lines = [
+            "We are still waiting for the following:" if not self.escalated
+            else "The following items are now overdue and have been escalated:",
+            "",
+        ]
+        several = len(self.client_ids) > 1
+        for t in self.tasks:
+            label = (t["item_name"] or "").replace("_", " ")
+            if several:
+                label = f"{t['client_name'] or t['client_id']}: {label}"
+            lines.append(f"- {label}: {t['reason'] or ''} (due {t['due_date']})")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "channel": self.channel,
+            "target": self.target,
+            "client_id": self.client_id,
+            "client_name": self.client_name,
+            "client_ids": self.client_ids,
+            "provider": self.provider,
+            "recipient": self.recipient,
+            "escalated": self.escalated,
+            "items": [t["item_name"] for t in self.tasks],
+        }
+
+
+def _unchased(view):
+    """The rows of `view` whose status does not already show their chase as sent."""
+    if not len(view) or "status" not in view.table.pools:
+        return view
+    table = view.table
+    pairs = np.stack([view.codes("status"), view.codes("next_state")], axis=1)
+    combos, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    status, next_state = table.pools["status"], table.pools["next_state"]
+    keep = np.array([not already_chased(status[s], next_state[n]) for s, n in combos.tolist()], dtype=bool)
+    return table.view(view.rows[keep[inverse.reshape(-1)]])
+
+
+def coalesce(table: TaskTable, states: Iterable[str] = DISPATCH_STATES) -> List[ChaseMessage]:
+    """
+    One ChaseMessage per recipient/channel for tasks moving into `states`
+    whose chase has not been sent yet. Provider tasks that name their
+    provider are grouped by provider across clients.
+    """
+    if "next_state" not in table.pools:
+        table = annotate_next_states(table)
+    view = _unchased(table.filter(next_state=list(states)))
+    if not len(view):
+        return []
+
+    keys = [k for k in COALESCE_KEYS if k in table.pools]
+    stacked = np.stack([view.codes(k) for k in keys], axis=1)
+    if "provider" in keys:
+        provider_target = table.pools["target"].lookup(ChaseTarget.PROVIDER.value)
+        named = (stacked[:, keys.index("provider")] != 0) & (stacked[:, keys.index("target")] == provider_target)
+        stacked[named, keys.index("client_id")] = 0
+    _, first, inverse = np.unique(stacked, axis=0, return_index=True, return_inverse=True)
+    # number groups by first appearance, then cut the rows sorted by group
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    group = rank[inverse.reshape(-1)]
+    rows = view.rows[np.argsort(group, kind="stable")]
+    bounds = np.cumsum(np.bincount(group))[:-1]
+
+    messages = []
+    for group_rows in np.split(rows, bounds):
+        tasks = list(table.view(group_rows))
+        head = tasks[0]
+        messages.append(ChaseMessage(
+            head["channel"], head["target"], head["client_id"],
+            head["client_name"], head.get("provider"), tasks,
+        ))
+    return messages
+
+
+class ContactBook:
+    def __init__(self, contacts: Optional[dict] = None):
+        self.contacts = contacts or {}
+
+    @classmethod
+    def load(cls, path=CONTACTS_PATH) -> "ContactBook":
+        try:
+            return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return cls()
+
+    def address(self, message: ChaseMessage) -> Optional[str]:
+        book = self.contacts.get(message.target) or {}
+        if message.target == "advisor":
+            entry = book
+        elif message.provider:
+            # a provider is addressed by name only: the message may cover many clients
+            wanted = message.provider.casefold()
+            entry = next((v for k, v in book.items() if k.casefold() == wanted), {})
+        else:
+            entry = book.get(message.client_id or "") or {}
+        return entry.get(message.channel)
+
+
+class SentLedger:
+    """
+    Chases that have been sent, by (client_id, item_name, due_date) -> the
+    status the task moved to. A rebuilt book with a new due date for an item
+    is chased afresh. Stored as a JSON list in data/chase_sent.json.
+    """
+
+    def __init__(self, path=SENT_LEDGER, entries: Optional[Dict[tuple, str]] = None):
+        self.path = Path(path)
+        self.entries: Dict[tuple, str] = entries or {}
+
+    @classmethod
+    def load(cls, path=SENT_LEDGER) -> "SentLedger":
+        try:
+            rows = json.loads(Path(path).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            rows = []
+        return cls(path, {(r["client_id"], r["item_name"], r["due_date"]): r["status"] for r in rows})
+
+    @classmethod
+    @asynccontextmanager
+    async def locked(cls, path=SENT_LEDGER, poll: float = LEDGER_POLL):
+        """
+        Load the ledger under an exclusive lock held until the block exits,
+        then save it, also when the block fails or is cancelled. The lock is
+        polled without blocking, so waiting for it never stalls the event
+        loop; each holder has its own open file, so it excludes other
+        dispatches in this process as well as in others.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(path.name + ".lock"), "a") as lock:
+            # two dispatches at once would otherwise both send the same chases
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(poll)
+            ledger = cls.load(path)
+            try:
+                yield ledger
+            finally:
+                ledger.save()
+
+    def save(self):
+        rows = [
+            {"client_id": c, "item_name": i, "due_date": d, "status": s}
+            for (c, i, d), s in sorted(self.entries.items(), key=lambda kv: tuple(x or "" for x in kv[0]))
+        ]
+        tmp = self.path.with_name(self.path.name + f".tmp{os.getpid()}")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def record(self, messages: Iterable[ChaseMessage], results: Iterable[dict]):
+        """Note the tasks of every message whose result is "sent"."""
+        for m, r in zip(messages, results):
+            if r.get("status") != "sent":
+                continue
+            for t in m.tasks:
+                sent = SENT_STATUS.get(t["next_state"])
+                key = (t["client_id"], t["item_name"], t["due_date"])
+                old = self.entries.get(key)
+                if sent is not None and (old is None or _RANK[ChaseStatus(old)] < _RANK[sent]):
+                    self.entries[key] = sent.value
+
+    def apply(self, table: TaskTable) -> TaskTable:
+        """`table` with statuses advanced to what the ledger says was sent (the same table if none)."""
+        if not self.entries or not len(table):
+            return table
+        statuses = table.values("status")
+        changed = False
+        for row, key in enumerate(zip(table.values("client_id"), table.values("item_name"), table.values("due_date"))):
+            sent = self.entries.get(key)
+            if sent is None:
+                continue
+            current = statuses[row]
+            if current is None or _RANK[ChaseStatus(current)] < _RANK[ChaseStatus(sent)]:
+                statuses[row] = sent
+                changed = True
+        return table.with_columns(status=statuses) if changed else table
+
+
+class RateLimiter:
+    """Token bucket: `rate` sends per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChannelAdapter:
+    """Sends ChaseMessages for one channel. Subclasses implement send()."""
+
+    channel = ""
+    rate = 50.0          # messages per second
+    burst = 50
+    concurrency = 20
+    max_attempts = 3
+    backoff = 0.5        # seconds, doubled per retry
+    default_recipient = None
+
+    async def send(self, message: ChaseMessage):
+        raise NotImplementedError
+
+    def is_permanent(self, error: Exception) -> bool:
+        """True if retrying `error` cannot help (a rejected address, say)."""
+        return False
+
+    async def close(self):
+        pass
+
+
+class SmtpAdapter(ChannelAdapter):
+    """
+    Email over SMTP. Up to `concurrency` sends run at once on worker threads,
+    each reusing an idle connection from the pool when there is one.
+    """
+
+    channel = "email"
+
+    def __init__(self, host: str = "localhost", port: int = 25, sender: str = "chaser@localhost",
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = False, timeout: float = 30.0, rate: float = 100.0, concurrency: int = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = int(rate) or 1
+        self.concurrency = concurrency
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+
+    @classmethod
+    def from_env(cls) -> "SmtpAdapter":
+        return cls(
+            host=os.getenv("ADVISOR_SMTP_HOST", "localhost"),
+            port=int(os.getenv("ADVISOR_SMTP_PORT", "25")),
+            sender=os.getenv("ADVISOR_SMTP_FROM", "chaser@localhost"),
+            username=os.getenv("ADVISOR_SMTP_USER"),
+            password=os.getenv("ADVISOR_SMTP_PASSWORD"),
+            starttls=os.getenv("ADVISOR_SMTP_STARTTLS", "").lower() in ("1", "true", "yes"),
+        )
+
+    def _send_sync(self, message: ChaseMessage):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = message.recipient
+        msg["Subject"] = message.subject
+        msg.set_content(message.body)
+
+        try:
+            smtp = self._idle.get_nowait()
+        except queue.Empty:
+            smtp = self._connect()
+        try:
+            smtp.send_message(msg)
+        except BaseException:
+            # the connection may be in a bad state; a retry opens a fresh one
+            smtp.close()
+            raise
+        self._idle.put(smtp)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        return smtp
+
+    async def send(self, message: ChaseMessage):
+        # smtplib is blocking, so sends run on worker threads
+        await asyncio.to_thread(self._send_sync, message)
+
+    def is_permanent(self, error: Exception) -> bool:
+        # 5xx replies (unknown mailbox, rejected sender, bad credentials) fail
+        # the same way every time; 4xx and dropped connections may not
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in error.recipients.values())
+        return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+    async def close(self):
+        while True:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                await asyncio.to_thread(smtp.quit)
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+
+class DashboardAdapter(ChannelAdapter):
+    channel = "dashboard"
+    rate = 1000.0
+    burst = 1000
+    default_recipient = "dashboard"
+
+    def __init__(self, path=DASHBOARD_FEED):
+        self.path = Path(path)
+        self._lock = asyncio.Lock()
+
+    async def send(self, message: ChaseMessage):
+        line = json.dumps({
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "subject": message.subject,
+            "body": message.body,
+            **message.to_dict(),
+        }, ensure_ascii=False)
+        async with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class SmsAdapter(ChannelAdapter):
+    """Stub: records messages instead of calling an SMS gateway."""
+
+    channel = "sms"
+    rate = 100.0
+    burst = 100
+
+    def __init__(self):
+        self.sent: List[dict] = []
+
+    async def send(self, message: ChaseMessage):
+        self.sent.append({"to": message.recipient, "text": f"{message.subject}. {len(message.tasks)} item(s) outstanding."})
+
+
+class Dispatcher:
+    def __init__(self, adapters: Iterable[ChannelAdapter], contacts: Optional[ContactBook] = None):
+        self.adapters: Dict[str, ChannelAdapter] = {a.channel: a for a in adapters}
+        self.contacts = contacts or ContactBook()
+
+    async def _deliver(self, adapter, limiter, gate, message) -> dict:
+        result = message.to_dict()
+        async with gate:
+            for attempt in range(1, adapter.max_attempts + 1):
+                await limiter.acquire()
+                try:
+                    await adapter.send(message)
+                    result.update(status="sent", attempts=attempt)
+                    return result
+                except Exception as e:
+                    result.update(status="failed", attempts=attempt, error=f"{type(e).__name__}: {e}")
+                    if adapter.is_permanent(e):
+                        break
+                    if attempt < adapter.max_attempts:
+                        await asyncio.sleep(adapter.backoff * 2 ** (attempt - 1))
+        return result
+
+    @staticmethod
+    async def _report(delivery, message, on_result) -> dict:
+        result = await delivery
+        if on_result is not None:
+            on_result(message, result)
+        return result
+
+    async def run(self, messages: Iterable[ChaseMessage], dry_run: bool = False,
+                  on_result=None) -> List[dict]:
+        """
+        Send `messages`; one result dict per message, in message order.
+        `on_result(message, result)` is called as each send finishes, so a
+        caller can record it even if the run is later cancelled.
+        """
+        limiters = {c: RateLimiter(a.rate, a.burst) for c, a in self.adapters.items()}
+        gates = {c: asyncio.Semaphore(a.concurrency) for c, a in self.adapters.items()}
+
+        messages = list(messages)
+        results: List[Optional[dict]] = [None] * len(messages)
+        jobs, job_rows = [], []
+        for i, m in enumerate(messages):
+            adapter = self.adapters.get(m.channel)
+            if adapter is None:
+                results[i] = {**m.to_dict(), "status": "skipped", "error": f"no adapter for {m.channel}"}
+                continue
+            m.recipient = self.contacts.address(m) or adapter.default_recipient
+            if not m.recipient:
+                results[i] = {**m.to_dict(), "status": "skipped", "error": "no contact address"}
+            elif dry_run:
+                results[i] = {**m.to_dict(), "status": "dry_run"}
+            else:
+                jobs.append(self._report(self._deliver(adapter, limiters[m.channel], gates[m.channel], m),
+                                         m, on_result))
+                job_rows.append(i)
+
+        # results stay in message order, so they line up with `messages`
+        for i, result in zip(job_rows, await asyncio.gather(*jobs)):
+            results[i] = result
+        for a in self.adapters.values():
+            await a.close()
+        return results
+
+
+def default_adapters() -> List[ChannelAdapter]:
+    return [SmtpAdapter.from_env(), DashboardAdapter(), SmsAdapter()]
+
+
+async def dispatch_chases(table: TaskTable, adapters: Optional[Iterable[ChannelAdapter]] = None,
+                          contacts: Optional[ContactBook] = None, dry_run: bool = False,
+                          ledger_path=SENT_LEDGER) -> List[dict]:
+    """
+    Coalesce the table's due chases that have not been sent yet and send
+    them; one result dict per message. Sent chases are recorded in the
+    ledger at ledger_path (not on a dry run), so calling this again does not
+    resend them; see advance_book for showing them in the book.
+    """
+    dispatcher = Dispatcher(adapters or default_adapters(), contacts or ContactBook.load())
+    if dry_run:
+        return await dispatcher.run(coalesce(SentLedger.load(ledger_path).apply(table)), dry_run=True)
+    async with SentLedger.locked(ledger_path) as ledger:
+        messages = coalesce(ledger.apply(table))
+        return await dispatcher.run(messages, on_result=lambda m, r: ledger.record([m], [r]))
+
+
+def advance_book(store, ledger: Optional[SentLedger] = None, log=None, attempts: int = 3):
+    """
+    Commit a generation of `store` whose book shows the ledger's sent chases
+    in its statuses, and record the transitions in `log` (a ChangeLog).
+    Returns the new Generation, or None if there was nothing to advance.
+    """
+    ledger = ledger or SentLedger.load()
+    for attempt in range(attempts):
+        base = store.current()
+        if base is None or not base.has(TASKS_NAME):
+            return None
+        table = TaskTable.from_json(base.path(TASKS_NAME).read_text(encoding="utf-8"))
+        advanced = ledger.apply(table)
+        if advanced is table:
+            return None
+        annotated = annotate_next_states(advanced)
+        try:
+            with store.begin(base=base) as gen:
+                gen.write_text(TASKS_NAME, advanced.to_json(indent=2))
+                gen.write_text(UPDATED_NAME, annotated.to_json(indent=2))
+        except StaleGenerationError:
+            if attempt == attempts - 1:
+                raise
+            continue
+        if log is not None:
+            log.record(feed_book(base), annotated)
+        return gen.generation
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    from chaser.run_doc_chaser import CHANGES_PATH, GENERATIONS_PATH, TASKS_PATH
+    from core.change_feed import ChangeLog
+    from core.generations import GenerationStore
+
+    parser = argparse.ArgumentParser(description="Send reminder/escalation chases")
+    parser.add_argument("tasks", nargs="?", help="tasks JSON (default: the current generation's)")
+    parser.add_argument("--contacts", default=str(CONTACTS_PATH))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    store = GenerationStore(GENERATIONS_PATH)
+    tasks_path = Path(args.tasks) if args.tasks else store.resolve(TASKS_NAME, TASKS_PATH)
+    if tasks_path is None:
+        parser.error("no tasks generated yet; run /run or ingestion.build_tasks_from_docs first")
+    table = TaskTable.from_json(tasks_path.read_text(encoding="utf-8"))
+    started = time.perf_counter()
+    results = asyncio.run(dispatch_chases(table, contacts=ContactBook.load(args.contacts), dry_run=args.dry_run))
+
+    for r in results:
+        if r["status"] not in ("sent", "dry_run"):
+            print(f"{r['status']}: {r['channel']} {r['target']} {r['client_name']} - {r.get('error')}")
+    counts = Counter(r["status"] for r in results)
+    print(f"{len(results)} messages in {time.perf_counter() - started:.2f}s: {dict(counts)}")
+    if not args.dry_run and not args.tasks and counts.get("sent"):
+        gen = advance_book(store, log=ChangeLog(CHANGES_PATH))
+        if gen is not None:
+            print(f"Sent chases recorded in generation {gen.number}")
@@ -0,0 +1,168 @@
+"""
+Chase-workload forecast: how many reminders and escalations fire on each of
+the next N days, by target and by channel.
+
+get_next_state moves an open task to REMINDER_SENT once it is more than 2
+days overdue and to ESCALATED once it is more than 5, so with nothing
+received in the meantime a task's reminder fires on due + 3 and its
+escalation on due + 6. The forecast projects that over the whole book with
+array operations on the due-date column: due dates are parsed once per
+distinct value (they are pooled), each task gets a reminder day and an
+escalation day relative to today, and the per-day counts are one bincount
+over (group, day) cells. Nothing is evaluated per task per day.
+
+Events that are already due today (overdue backlog) land on day 0; a task
+already past its escalation threshold only escalates, it is not reminded
+first. A task whose status is follow_up_sent only has its escalation left;
+escalated, received and completed tasks have nothing left to fire.
+
+    python -m chaser.forecast [tasks.json] [--days 30] [--json]
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.constants import ChaseStatus
+from core.task_table import StringPool, TaskTable
+
+REMINDER_AFTER_DAYS = 3         # first day with days_overdue > 2
+ESCALATION_AFTER_DAYS = 6       # first day with days_overdue > 5
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+
+GROUP_FIELDS = ("target", "channel")
+
+REMINDER_PENDING = (ChaseStatus.NOT_STARTED, ChaseStatus.REQUESTED)
+ESCALATION_PENDING = REMINDER_PENDING + (ChaseStatus.FOLLOW_UP_SENT,)
+
+_NO_DUE = 0                     # date.toordinal() starts at 1
+
+
+def _pool_ordinals(pool: StringPool) -> np.ndarray:
+    """date.toordinal() for every value of a due_date pool (_NO_DUE if missing/invalid)."""
+    out = np.full(len(pool), _NO_DUE, dtype=np.int64)
+    for code, value in enumerate(pool.values):
+        if not value:
+            continue
+        try:
+            out[code] = date.fromisoformat(value[:10]).toordinal()
+        except ValueError:
+            pass
+    return out
+
+
+def _status_mask(pool: StringPool, statuses: Sequence[ChaseStatus]) -> np.ndarray:
+    """Per pool code: is the status one of `statuses`? (None counts as not_started)"""
+    mask = np.zeros(len(pool), dtype=bool)
+    for code, value in enumerate(pool.values):
+        try:
+            mask[code] = ChaseStatus(value or ChaseStatus.NOT_STARTED) in statuses
+        except ValueError:
+            pass
+    return mask
+
+
+def _event_counts(days: np.ndarray, fire: np.ndarray, groups: np.ndarray,
+                  n_groups: int, horizon: int) -> np.ndarray:
+    """n_groups x horizon counts of events firing on each day."""
+    fire = fire & (days < horizon)
+    cells = groups[fire] * horizon + days[fire]
+    return np.bincount(cells, minlength=n_groups * horizon).reshape(n_groups, horizon)
+
+
+def _series(pool: StringPool, counts: np.ndarray) -> Dict[Optional[str], List[int]]:
+    return {pool[code]: row.tolist() for code, row in enumerate(counts) if row.any()}
+
+
+def forecast(table: TaskTable, days: int = DEFAULT_DAYS, today: Optional[date] = None) -> dict:
+    """
+    Reminder / escalation counts per day for days [today, today + days).
+
+    {"start": "YYYY-MM-DD", "dates": [...],
+     "reminders":   {"total": [...], "by_target": {t: [...]}, "by_channel": {c: [...]}},
+     "escalations": {...same...}}
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    today = today or datetime.utcnow().date()
+    dates = [(today + timedelta(days=d)).isoformat() for d in range(days)]
+
+    empty = {"total": [0] * days, "by_target": {}, "by_channel": {}}
+    if not len(table):
+        return {"start": dates[0], "dates": dates, "reminders": empty, "escalations": dict(empty)}
+
+    due = _pool_ordinals(table.pools["due_date"])[table.codes("due_date")]
+    status_pool, status_codes = table.pools["status"], table.codes("status")
+    has_due = due != _NO_DUE
+    offset = due - today.toordinal()
+
+    # day index each event fires on, overdue backlog clipped to today
+    esc_day = np.maximum(offset + ESCALATION_AFTER_DAYS, 0)
+    rem_day = np.maximum(offset + REMINDER_AFTER_DAYS, 0)
+    escalates = has_due & _status_mask(status_pool, ESCALATION_PENDING)[status_codes]
+    # already past the escalation threshold: straight to ESCALATED, no reminder
+    reminds = has_due & _status_mask(status_pool, REMINDER_PENDING)[status_codes] & (esc_day > 0)
+
+    # one cell per (target code, channel code); both pools are tiny
+    target_pool, channel_pool = (table.pools.get(f) or StringPool() for f in GROUP_FIELDS)
+    shape = (len(target_pool), len(channel_pool))
+    groups = np.zeros(len(table), dtype=np.int64)
+    if "target" in table.pools:
+        groups += table.codes("target").astype(np.int64) * shape[1]
+    if "channel" in table.pools:
+        groups += table.codes("channel")
+
+    out = {"start": dates[0], "dates": dates}
+    for name, day, fire in (("reminders", rem_day, reminds), ("escalations", esc_day, escalates)):
+        counts = _event_counts(day, fire, groups, shape[0] * shape[1], days).reshape(*shape, days)
+        out[name] = {
+            "total": counts.sum(axis=(0, 1)).tolist(),
+            "by_target": _series(target_pool, counts.sum(axis=1)),
+            "by_channel": _series(channel_pool, counts.sum(axis=0)),
+        }
+    return out
+
+
+def forecast_rows(result: dict) -> List[dict]:
+    """The forecast as one row per day, for printing."""
+    rows = []
+    for i, d in enumerate(result["dates"]):
+        row = {"date": d}
+        for name in ("reminders", "escalations"):
+            section = result[name]
+            row[name] = section["total"][i]
+            for field in GROUP_FIELDS:
+                for key, series in section[f"by_{field}"].items():
+                    if series[i]:
+                        row[f"{name}.{key}"] = series[i]
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from pathlib import Path
+
+    from chaser.run_doc_chaser import GENERATIONS_PATH, TASKS_PATH
+    from core.generations import TASKS_NAME, GenerationStore
+
+    parser = argparse.ArgumentParser(description="Forecast reminders and escalations per day")
+    parser.add_argument("tasks", nargs="?", help="tasks JSON (default: the current generation's)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--json", action="store_true", help="print the full forecast as JSON")
+    args = parser.parse_args()
+
+    tasks_path = Path(args.tasks) if args.tasks else GenerationStore(GENERATIONS_PATH).resolve(TASKS_NAME, TASKS_PATH)
+    if tasks_path is None:
+        parser.error("no tasks generated yet; run /run or ingestion.build_tasks_from_docs first")
+    result = forecast(TaskTable.from_json(tasks_path.read_text(encoding="utf-8")), args.days)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for row in forecast_rows(result):
+            if row["reminders"] or row["escalations"]:
+                detail = ", ".join(f"{k}={v}" for k, v in row.items() if "." in k)
+                print(f"{row['date']}  reminders {row['reminders']:>6}  escalations {row['escalations']:>6}  {detail}")
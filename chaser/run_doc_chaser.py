@@ -1,10 +1,25 @@
-import json
+from itertools import islice
 from pathlib import Path
+from typing import Optional
+
+import numpy as np
 
 from chaser.state_machine import get_next_state
+from core.change_feed import ChangeLog
+from core.generations import (
+    SNAPSHOT_NAME,
+    TASKS_NAME,
+    UPDATED_NAME,
+    GenerationStore,
+    StaleGenerationError,
+)
+from core.task_table import StringPool, TaskTable
 
+GENERATIONS_PATH = Path("data/generations")
+# pre-generation layout, read only when no generation has been committed
 TASKS_PATH = Path("data/doc_tasks.json")
 OUT_PATH = Path("data/doc_tasks_updated.json")
+CHANGES_PATH = Path("data/task_changes.jsonl")
 
 def recommend_action(task, next_state: str) -> str:
     channel = task.get("channel", "email")
@@ -22,29 +37,93 @@ def recommend_action(task, next_state: str) -> str:
 
     return f"Send initial request via {channel}"
 
-if __name__ == "__main__":
-    tasks = json.loads(TASKS_PATH.read_text(encoding="utf-8"))
+def annotate_next_states(table: TaskTable) -> TaskTable:
+    """
+    Add next_state and recommended_action columns.
+
+    Both only depend on (status, due_date, channel, target), and a book has
+    far fewer distinct combinations than tasks, so the state machine runs once
+    per combination and the result is broadcast back over the rows.
+    """
+    keys = ("status", "due_date", "channel", "target")
+    if not len(table):
+        return table.with_columns(next_state=[], recommended_action=[])
+
+    stacked = np.stack([table.codes(k) for k in keys], axis=1)
+    combos, inverse = np.unique(stacked, axis=0, return_inverse=True)
+
+    next_pool, action_pool = StringPool(), StringPool()
+    next_codes, action_codes = [], []
+    for combo in combos.tolist():
+        t = {k: table.pools[k][c] for k, c in zip(keys, combo) if c}
+        next_state = get_next_state(t)
+        next_codes.append(next_pool.code(next_state))
+        action_codes.append(action_pool.code(recommend_action(t, next_state)))
+
+    inverse = inverse.reshape(-1)
+    return table.with_columns(
+        next_state=(next_pool, np.asarray(next_codes, dtype=np.uint32)[inverse]),
+        recommended_action=(action_pool, np.asarray(action_codes, dtype=np.uint32)[inverse]),
+    )
 
-    updated = []
-    for t in tasks:
-        next_state = get_next_state({
-            "status": t["status"].upper() if t["status"].islower() else t["status"],
-            "due_date": t["due_date"]
-        })
+def feed_book(generation) -> Optional[TaskTable]:
+    """
+    The book the change feed describes for a generation: the annotated one
+    (doc_tasks_updated.json) that /run and chaser passes both write and log,
+    or, for a generation written without it, its doc_tasks.json annotated now.
+    """
+    if generation is None:
+        return None
+    if generation.has(UPDATED_NAME):
+        return TaskTable.from_json(generation.path(UPDATED_NAME).read_text(encoding="utf-8"))
+    if generation.has(TASKS_NAME):
+        return annotate_next_states(TaskTable.from_json(generation.path(TASKS_NAME).read_text(encoding="utf-8")))
+    return None
 
-        action = recommend_action(t, next_state)
-        updated.append({**t, "next_state": next_state, "recommended_action": action})
 
-    OUT_PATH.write_text(json.dumps(updated, indent=2), encoding="utf-8")
-    print(f"Updated tasks saved to {OUT_PATH}")
+def chase_pass(store: GenerationStore, attempts: int = 3):
+    """
+    Annotate the current book and commit it, with the unchanged book, as a
+    new generation. Starts over if another pass commits first, so a /run
+    that lands meanwhile is never overwritten with an annotation of the
+    book it replaced. Returns (previous updated table or None, new table, generation).
+    """
+    for attempt in range(attempts):
+        current = store.current()
+        if current is not None:
+            tasks_path = current.path(TASKS_NAME)
+            previous = feed_book(current)
+        else:
+            tasks_path = TASKS_PATH
+            previous = TaskTable.from_json(OUT_PATH.read_text(encoding="utf-8")) if OUT_PATH.exists() else None
+
+        tasks_json = tasks_path.read_text(encoding="utf-8")
+        table = annotate_next_states(TaskTable.from_json(tasks_json))
+
+        # the new generation carries the unchanged book over and adds the updated one
+        try:
+            with store.begin(base=current) as gen:
+                if not gen.link_from(current, TASKS_NAME):
+                    gen.write_text(TASKS_NAME, tasks_json)
+                gen.link_from(current, SNAPSHOT_NAME)
+                gen.write_text(UPDATED_NAME, table.to_json(indent=2))
+        except StaleGenerationError:
+            if attempt == attempts - 1:
+                raise
+            continue
+        return previous, table, gen.generation
+
+
+if __name__ == "__main__":
+    previous, table, generation = chase_pass(GenerationStore(GENERATIONS_PATH))
+    print(f"Updated tasks saved to {generation.path(UPDATED_NAME)}")
 
-    by_client = {}
-    for u in updated:
-        by_client.setdefault(u["client_name"], []).append(u)
+    cursor = ChangeLog(CHANGES_PATH).record(previous, table)
+    print(f"Change log at {cursor}")
 
-    for client, items in by_client.items():
+    for client, view in table.group_by("client_name").items():
         print(f"\nCLIENT: {client}")
-        for it in items[:10]:
+        for it in islice(view, 10):
             print(f"- {it['item_name']} | {it['required_for']} | {it['target']} | {it['priority']}")
             print(f"  due: {it['due_date']} | state: {it['status']} -> {it['next_state']}")
             print(f"  action: {it['recommended_action']}")
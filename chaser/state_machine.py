@@ -1,16 +1,30 @@
 from datetime import datetime
 
+from core.constants import ChaseStatus
+
 def get_next_state(task):
     """
     Decide the next state of a task
     based on due date and current status.
+
+    Accepts any casing of ChaseStatus ("not_started" / "NOT_STARTED");
+    returns the chaser's upper-case state names. A missing status counts as
+    NOT_STARTED; a task without a due date stays in its current state.
     """
 
-    if task["status"] == "COMPLETED":
+    status = ChaseStatus(task.get("status") or ChaseStatus.NOT_STARTED)
+    if status == ChaseStatus.COMPLETED:
         return "COMPLETED"
 
+    due = task.get("due_date")
+    if not due:
+        return status.name
+
     today = datetime.utcnow()
-    due = datetime.fromisoformat(task["due_date"])
+    if isinstance(due, str):
+        due = datetime.fromisoformat(due)
+    elif not isinstance(due, datetime):
+        due = datetime.combine(due, datetime.min.time())
 
     days_overdue = (today - due).days
 
@@ -19,4 +33,4 @@ def get_next_state(task):
     elif days_overdue > 2:
         return "REMINDER_SENT"
     else:
-        return task["status"]
+        return status.name
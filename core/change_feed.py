@@ -0,0 +1,224 @@
+"""
+Append-only change log for the task book.
+
+Whenever a new book replaces the old one (/run, a chaser pass) the two are
+diffed by task key (client_id, item_name) and the differences are appended
+to data/task_changes.jsonl, one JSON object per line:
+
+    {"seq": 42, "op": "insert" | "transition" | "update" | "delete",
+     "key": {"client_id": ..., "item_name": ...}, "task": {...} | null,
+     "from": "<old state>", "to": "<new state>", "at": "<utc iso>"}
+
+"transition" is a change of status or next_state; any other field change is
+"update". seq increases by one per entry and is the cursor clients pass back
+to get everything after it. The log keeps the newest MAX_ENTRIES entries; a
+cursor older than that gets {"reset": true} and should refetch /tasks.
+
+/run and chaser passes both log the annotated book (doc_tasks_updated.json,
+see chaser.run_doc_chaser.feed_book), so every entry diffs the same book.
+
+Writers in any process serialise on an flock of <log>.lock around
+refresh + append (+ compaction), so two processes can't hand out the same seq.
+Any number of readers, including other worker processes, pick up appended
+lines by file size without locking.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.task_table import TaskTable
+
+DEFAULT_LOG = Path("data/task_changes.jsonl")
+MAX_ENTRIES = 100_000
+POLL_INTERVAL = 0.25
+
+KEY_FIELDS = ("client_id", "item_name")
+STATE_FIELDS = ("status", "next_state")
+
+
+def _rows_by_key(table: Optional[TaskTable]) -> Dict[Tuple, dict]:
+    if table is None:
+        return {}
+    return {tuple(t.get(k) for k in KEY_FIELDS): t for t in table}
+
+
+def diff_tables(old: Optional[TaskTable], new: Optional[TaskTable]) -> List[dict]:
+    """Change entries (without seq/at) that turn `old` into `new`."""
+    before, after = _rows_by_key(old), _rows_by_key(new)
+    changes = []
+    for key, task in after.items():
+        key_dict = dict(zip(KEY_FIELDS, key))
+        prev = before.get(key)
+        if prev is None:
+            changes.append({"op": "insert", "key": key_dict, "task": task})
+        elif prev != task:
+            entry = {"op": "update", "key": key_dict, "task": task}
+            for f in STATE_FIELDS:
+                if prev.get(f) != task.get(f):
+                    entry.update(op="transition", **{"from": prev.get(f), "to": task.get(f)})
+            changes.append(entry)
+    for key in before.keys() - after.keys():
+        changes.append({"op": "delete", "key": dict(zip(KEY_FIELDS, key)), "task": None})
+    return changes
+
+
+class ChangeLog:
+    def __init__(self, path=DEFAULT_LOG, max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self._entries: List[dict] = []
+        self._read_pos = 0
+        self._file_entries = 0
+        self._stat = None
+        self._wakeup = None       # (loop, asyncio.Event) shared by waiters in this process
+        self._lock = threading.RLock()
+
+    # ---------- reads ----------
+
+    def refresh(self):
+        """Pick up entries appended (by any process) since the last refresh."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            self._entries, self._read_pos, self._file_entries, self._stat = [], 0, 0, None
+            return
+        if self._stat is not None and st.st_ino != self._stat.st_ino or st.st_size < self._read_pos:
+            # the log was compacted (rewritten); reload it
+            self._entries, self._read_pos, self._file_entries = [], 0, 0
+        self._stat = st
+        if st.st_size == self._read_pos:
+            return
+
+        with self.path.open("rb") as f:
+            f.seek(self._read_pos)
+            data = f.read(st.st_size - self._read_pos)
+        # ignore a trailing partial line; it is read once complete
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._entries.append(json.loads(line))
+                self._file_entries += 1
+        self._read_pos += end
+        if len(self._entries) > self.max_entries:
+            del self._entries[:len(self._entries) - self.max_entries]
+
+    @property
+    def cursor(self) -> int:
+        """seq of the newest entry (0 if the log is empty)."""
+        with self._lock:
+            self._refresh()
+            return self._entries[-1]["seq"] if self._entries else 0
+
+    def since(self, cursor: int, limit: int = 1000) -> dict:
+        with self._lock:
+            self._refresh()
+            entries = self._entries
+            first = entries[0]["seq"] if entries else 1
+            last = entries[-1]["seq"] if entries else 0
+            if cursor > last or cursor < first - 1 and entries:
+                return {"reset": True, "cursor": last, "changes": []}
+
+            start = max(0, cursor - first + 1)
+            changes = entries[start:start + limit]
+        return {
+            "reset": False,
+            "cursor": changes[-1]["seq"] if changes else cursor,
+            "changes": changes,
+        }
+
+    async def wait(self, cursor: int, timeout: float = 25.0, limit: int = 1000) -> dict:
+        """since(), but if nothing is newer than cursor wait up to timeout for it."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            out = self.since(cursor, limit)
+            remaining = deadline - loop.time()
+            if out["changes"] or out["reset"] or remaining <= 0:
+                return out
+            # woken early by an append in this process, otherwise poll the file
+            if self._wakeup is None:
+                self._wakeup = (loop, asyncio.Event())
+            try:
+                await asyncio.wait_for(self._wakeup[1].wait(), min(POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    # ---------- writes ----------
+
+    @contextmanager
+    def _writing(self):
+        """This process's lock, then the cross-process one on <log>.lock."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                yield
+
+    def append(self, changes: List[dict]) -> int:
+        """Append entries, assigning seq numbers. Returns the new cursor."""
+        with self._writing():
+            seq = self._append(changes)
+        if self._wakeup is not None:
+            # writers run on worker threads; wake the waiters on their loop
+            loop, event = self._wakeup
+            self._wakeup = None
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass            # that loop has since been closed
+        return seq
+
+    def _append(self, changes: List[dict]) -> int:
+        self._refresh()
+        seq = self._entries[-1]["seq"] if self._entries else 0
+        if not changes:
+            return seq
+
+        at = datetime.utcnow().isoformat(timespec="seconds")
+        lines = []
+        for c in changes:
+            seq += 1
+            lines.append(json.dumps({"seq": seq, **c, "at": at}, ensure_ascii=False, separators=(",", ":")))
+
+        with self.path.open("ab") as f:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._refresh()
+
+        if self._file_entries > 2 * self.max_entries:
+            self._compact()
+        return seq
+
+    def compact(self):
+        """Rewrite the file with only the retained entries (temp file + rename)."""
+        with self._writing():
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path.with_name(self.path.name + f".tmp{os.getpid()}")
+        with tmp.open("wb") as f:
+            for e in self._entries:
+                f.write((json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._stat = None
+        self._entries, self._read_pos, self._file_entries = [], 0, 0
+        self._refresh()
+
+    def record(self, old: Optional[TaskTable], new: Optional[TaskTable]) -> int:
+        """Diff two books and append the result."""
+        return self.append(diff_tables(old, new))
@@ -0,0 +1,193 @@
+"""
+Per-client rollups of the task book, kept up to date from the change feed.
+
+The chaser dashboard mostly needs one row per client rather than the task
+list. ClientSummaries holds, per client_id, counters that are adjusted by
+each change-feed entry (insert / update / transition / delete), so the cost
+of an update is O(changed tasks) and a read is O(clients):
+
+    {"client_id", "client_name", "tasks", "open",
+     "by_status": {...}, "by_priority": {...}, "by_target": {...},
+     "earliest_due": "YYYY-MM-DD" | null,
+     "overdue", "reminders_due", "escalations_due",
+     "blocking_stage": "<AdviceStage>" | null}
+
+A task is open until its status is completed (as in get_next_state); the
+priority / target counts, due dates and blocking stage cover open tasks only.
+The blocking stage is the earliest AdviceStage with an open task.
+
+Overdue counts depend on the day, not on any task change, so each client
+keeps its open due dates sorted and they are counted with a bisect using the
+same thresholds as get_next_state (more than 2 / 5 days overdue). The
+rendered rows are cached until the next change or the next day.
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.change_feed import KEY_FIELDS, ChangeLog
+from core.constants import AdviceStage, ChaseStatus
+from core.task_table import TaskTable
+
+STAGE_ORDER = list(AdviceStage)
+
+REMINDER_DAYS = 2
+ESCALATION_DAYS = 5
+
+
+def _status(task: dict) -> str:
+    try:
+        return ChaseStatus(task.get("status") or ChaseStatus.NOT_STARTED).value
+    except ValueError:
+        return task.get("status")
+
+
+def _due(task: dict) -> str:
+    return str(task.get("due_date") or "")[:10]
+
+
+class ClientSummary:
+    __slots__ = ("client_id", "client_name", "tasks", "by_status", "by_priority",
+                 "by_target", "by_stage", "open_dues")
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.client_name: Optional[str] = None
+        self.tasks = 0
+        self.by_status: Counter = Counter()
+        self.by_priority: Counter = Counter()
+        self.by_target: Counter = Counter()
+        self.by_stage: Counter = Counter()
+        self.open_dues: List[str] = []      # sorted ISO dates of open tasks
+
+    def add(self, task: dict, sign: int):
+        """Add (sign=1) or remove (sign=-1) one task's contribution."""
+        status = _status(task)
+        self.tasks += sign
+        self.by_status[status] += sign
+        if task.get("client_name"):
+            self.client_name = task["client_name"]
+        if status == ChaseStatus.COMPLETED.value:
+            return
+
+        self.by_priority[task.get("priority")] += sign
+        self.by_target[task.get("target")] += sign
+        self.by_stage[task.get("required_for")] += sign
+        due = _due(task)
+        if not due:
+            return
+        if sign > 0:
+            insort(self.open_dues, due)
+        else:
+            i = bisect_left(self.open_dues, due)
+            if i < len(self.open_dues) and self.open_dues[i] == due:
+                del self.open_dues[i]
+
+    def row(self, cutoffs: Tuple[str, str, str]) -> dict:
+        today, reminder, escalation = cutoffs
+        overdue = bisect_left(self.open_dues, today)
+        past_reminder = bisect_left(self.open_dues, reminder)
+        past_escalation = bisect_left(self.open_dues, escalation)
+        blocking = next((s.value for s in STAGE_ORDER if self.by_stage[s.value] > 0), None)
+        return {
+            "client_id": self.client_id,
+            "client_name": self.client_name,
+            "tasks": self.tasks,
+            "open": self.tasks - self.by_status[ChaseStatus.COMPLETED.value],
+            "by_status": {k: n for k, n in self.by_status.items() if n > 0},
+            "by_priority": {k: n for k, n in self.by_priority.items() if n > 0},
+            "by_target": {k: n for k, n in self.by_target.items() if n > 0},
+            "earliest_due": self.open_dues[0] if self.open_dues else None,
+            "overdue": overdue,
+            "reminders_due": past_reminder - past_escalation,
+            "escalations_due": past_escalation,
+            "blocking_stage": blocking,
+        }
+
+
+def _cutoffs(now: datetime) -> Tuple[str, str, str]:
+    """Due dates strictly before these are overdue / reminder / escalation due."""
+    today = now.date()
+    return (
+        today.isoformat(),
+        (today - timedelta(days=REMINDER_DAYS)).isoformat(),
+        (today - timedelta(days=ESCALATION_DAYS)).isoformat(),
+    )
+
+
+class ClientSummaries:
+    def __init__(self):
+        self._tasks: Dict[Tuple, dict] = {}
+        self._clients: Dict[str, ClientSummary] = {}
+        self._cursor: Optional[int] = None
+        self._rows: Optional[List[dict]] = None
+        self._rows_cutoffs = None
+        self._lock = threading.RLock()
+
+    # ---------- updates ----------
+
+    def _put(self, key: Tuple, task: Optional[dict]):
+        old = self._tasks.pop(key, None)
+        if old is not None:
+            summary = self._clients[old.get("client_id")]
+            summary.add(old, -1)
+            if summary.tasks == 0:
+                del self._clients[summary.client_id]
+        if task is not None:
+            self._tasks[key] = task
+            cid = task.get("client_id")
+            summary = self._clients.get(cid)
+            if summary is None:
+                summary = self._clients[cid] = ClientSummary(cid)
+            summary.add(task, 1)
+
+    def apply(self, changes: Iterable[dict]):
+        """Apply change-feed entries. Entries carry the whole new task, so replaying one is harmless."""
+        with self._lock:
+            for c in changes:
+                key = tuple(c["key"].get(k) for k in KEY_FIELDS)
+                self._put(key, c.get("task"))
+                self._rows = None
+
+    def load(self, table: Optional[TaskTable]):
+        """Rebuild from a whole book."""
+        with self._lock:
+            self._tasks, self._clients, self._rows = {}, {}, None
+            for t in table if table is not None else ():
+                self._put(tuple(t.get(k) for k in KEY_FIELDS), t)
+
+    def sync(self, log: ChangeLog, load_table: Callable[[], Optional[TaskTable]]):
+        """
+        Catch up with the change log. The first call (or a cursor the log has
+        dropped) rebuilds from load_table(); afterwards only new entries are applied.
+        """
+        with self._lock:
+            if self._cursor is not None:
+                out = log.since(self._cursor, limit=10_000)
+                while not out["reset"] and out["changes"]:
+                    self.apply(out["changes"])
+                    self._cursor = out["cursor"]
+                    out = log.since(self._cursor, limit=10_000)
+                if not out["reset"]:
+                    return
+            # cursor first: changes landing meanwhile are replayed next time
+            cursor = log.cursor
+            self.load(load_table())
+            self._cursor = cursor
+
+    # ---------- reads ----------
+
+    def rows(self, now: Optional[datetime] = None) -> List[dict]:
+        cutoffs = _cutoffs(now or datetime.utcnow())
+        with self._lock:
+            if self._rows is None or self._rows_cutoffs != cutoffs:
+                self._rows = [s.row(cutoffs) for s in self._clients.values()]
+                self._rows_cutoffs = cutoffs
+            return self._rows
+
+    def get(self, client_id: str, now: Optional[datetime] = None) -> Optional[dict]:
+        with self._lock:
+            summary = self._clients.get(client_id)
+            return None if summary is None else summary.row(_cutoffs(now or datetime.utcnow()))
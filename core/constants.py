@@ -5,6 +5,7 @@ class ChaseTarget(str, Enum):
     CLIENT = "client"
     PROVIDER = "provider"
     INVESTMENT_FIRM = "investment_firm"
+    ADVISOR = "advisor"
 
 
 class ChaseChannel(str, Enum):
@@ -30,6 +31,16 @@ class ChaseStatus(str, Enum):
     RECEIVED = "received"
     COMPLETED = "completed" 
 
+    @classmethod
+    def _missing_(cls, value):
+        # older task files carry upper-case statuses ("NOT_STARTED")
+        if isinstance(value, str):
+            lowered = value.lower()
+            for member in cls:
+                if member.value == lowered:
+                    return member
+        return None
+
 
 class AdviceStage(str, Enum):
     """
@@ -0,0 +1,229 @@
+"""
+Generation-numbered output directories with a single "current" pointer.
+
+Each /run or chaser pass writes its outputs into a fresh directory
+
+    data/generations/.tmp-XXXXXXXX/    while being written (files fsynced)
+    data/generations/000042/           after an atomic rename on commit
+
+and then atomically replaces data/generations/CURRENT (temp file + fsync +
+rename) with the new number. A committed generation is never modified, so a
+reader resolves CURRENT once, keeps that Generation for the whole request
+and reads consistent files from it without taking any lock; a rebuild in
+progress is invisible until its commit.
+
+A pass that derives its output from the current generation passes it as
+`base`; the commit then fails with StaleGenerationError if another pass
+committed in between, instead of silently overwriting that pass's work.
+
+    store = GenerationStore()
+    base = store.current()
+    with store.begin(base=base) as gen:
+        gen.write_text("doc_tasks.json", ...)
+        gen.link_from(base, "doc_tasks.snapshot")   # carry a file over
+    store.current().path("doc_tasks.json")
+
+The newest KEEP generations are kept. An older one is only removed once the
+generation that replaced it is PRUNE_GRACE seconds old, so a reader that
+resolved it just before a commit still finds its files; files a reader has
+already opened (or mapped) stay readable after removal anyway.
+"""
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+DEFAULT_ROOT = Path("data/generations")
+POINTER = "CURRENT"
+KEEP = 3
+# seconds a replaced generation stays on disk for readers that resolved it
+PRUNE_GRACE = 300.0
+
+TASKS_NAME = "doc_tasks.json"
+SNAPSHOT_NAME = "doc_tasks.snapshot"
+UPDATED_NAME = "doc_tasks_updated.json"
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StaleGenerationError(RuntimeError):
+    """Another generation was committed after the one a pass started from."""
+
+
+# begin() without a base: commit on top of whatever is current
+_ANY = object()
+
+
+class Generation:
+    """A committed, read-only output directory."""
+
+    __slots__ = ("number", "dir")
+
+    def __init__(self, number: int, dir: Path):
+        self.number = number
+        self.dir = dir
+
+    def path(self, name: str) -> Path:
+        return self.dir / name
+
+    def has(self, name: str) -> bool:
+        return (self.dir / name).exists()
+
+    def __repr__(self):
+        return f"Generation({self.number})"
+
+
+class GenerationWriter:
+    """A generation being written. Files only become visible on commit."""
+
+    def __init__(self, store: "GenerationStore", dir: Path):
+        self.store = store
+        self.dir = dir
+        self.generation: Optional[Generation] = None     # set on commit
+
+    def path(self, name: str) -> Path:
+        """Where to write `name` (for writers that manage their own file, e.g. write_snapshot)."""
+        return self.dir / name
+
+    def write_bytes(self, name: str, data: bytes):
+        with open(self.dir / name, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_text(self, name: str, text: str):
+        self.write_bytes(name, text.encode("utf-8"))
+
+    def link_from(self, generation: Optional[Generation], name: str) -> bool:
+        """Carry an unchanged file over from another generation (hard link, else copy)."""
+        if generation is None or not generation.has(name):
+            return False
+        src, dst = generation.path(name), self.dir / name
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        return True
+
+
+class GenerationStore:
+    def __init__(self, root=DEFAULT_ROOT, keep: int = KEEP, prune_grace: float = PRUNE_GRACE):
+        self.root = Path(root)
+        self.keep = keep
+        self.prune_grace = prune_grace
+        self._pointer_stat = None
+        self._current: Optional[Generation] = None
+
+    # ---------- reads ----------
+
+    def current(self) -> Optional[Generation]:
+        """The committed generation CURRENT points at, or None before the first commit."""
+        pointer = self.root / POINTER
+        try:
+            st = pointer.stat()
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp != self._pointer_stat:
+            number = int(pointer.read_text(encoding="utf-8").strip())
+            self._current = Generation(number, self.root / f"{number:06d}")
+            self._pointer_stat = stamp
+        return self._current
+
+    def resolve(self, name: str, legacy: Optional[Path] = None) -> Optional[Path]:
+        """Path of `name` in the current generation, or `legacy` if there is none yet."""
+        gen = self.current()
+        if gen is not None:
+            return gen.path(name) if gen.has(name) else None
+        return legacy if legacy is not None and legacy.exists() else None
+
+    def numbers(self) -> List[int]:
+        if not self.root.is_dir():
+            return []
+        return sorted(int(p.name) for p in self.root.iterdir() if p.is_dir() and p.name.isdigit())
+
+    # ---------- writes ----------
+
+    @contextmanager
+    def begin(self, base=_ANY):
+        """
+        Yield a GenerationWriter; commit it if the block succeeds, discard it
+        otherwise. With `base` (a Generation, or None for "nothing committed
+        yet") the commit raises StaleGenerationError unless CURRENT is still
+        `base`.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.root))
+        writer = GenerationWriter(self, tmp)
+        try:
+            yield writer
+            writer.generation = self._commit(tmp, base)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def _read_pointer(self) -> Optional[int]:
+        try:
+            return int((self.root / POINTER).read_text(encoding="utf-8").strip())
+        except FileNotFoundError:
+            return None
+
+    def _commit(self, tmp: Path, base=_ANY) -> Generation:
+        _fsync_dir(tmp)
+        with open(self.root / ".lock", "w") as lock:
+            # serialises commits from several processes; readers never take it
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if base is not _ANY:
+                expected = base.number if base is not None else None
+                live = self._read_pointer()
+                if live != expected:
+                    raise StaleGenerationError(
+                        f"generation {live} was committed after {expected}, which this pass started from"
+                    )
+            numbers = self.numbers()
+            number = (numbers[-1] if numbers else 0) + 1
+            final = self.root / f"{number:06d}"
+            os.chmod(tmp, 0o755)        # mkdtemp creates it 0700
+            os.rename(tmp, final)
+            _fsync_dir(self.root)
+
+            ptr_tmp = self.root / f"{POINTER}.tmp{os.getpid()}"
+            with open(ptr_tmp, "w", encoding="utf-8") as f:
+                f.write(f"{number}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(ptr_tmp, self.root / POINTER)
+            _fsync_dir(self.root)
+
+            self._prune(number)
+        return Generation(number, final)
+
+    def _prune(self, current: int):
+        numbers = self.numbers()
+        now = time.time()
+        for n, successor in zip(numbers[:-self.keep], numbers[1:]):
+            if n == current:
+                continue
+            try:
+                replaced_at = (self.root / f"{successor:06d}").stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if now - replaced_at < self.prune_grace:
+                # a reader may have resolved it just before it was replaced
+                continue
+            shutil.rmtree(self.root / f"{n:06d}", ignore_errors=True)
@@ -1,6 +1,9 @@
-from typing import List, Optional, Dict, Any
+import gc
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Sequence, get_type_hints
 from datetime import date, datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from typing_extensions import NotRequired, TypedDict
 
 from core.constants import (
     ChaseTarget,
@@ -54,15 +57,19 @@ class ChaseItem(BaseModel):
     This is the single object the state machine acts on.
     IMPORTANT: due_date is required for reminders/escalations.
     """
+    client_id: Optional[str] = None
+    client_name: Optional[str] = None
+
     item_name: str
     required_for: AdviceStage
     target: ChaseTarget
+    provider: Optional[str] = None      # for target=provider: who to chase
 
     status: ChaseStatus = ChaseStatus.NOT_STARTED
     priority: ChasePriority = ChasePriority.MEDIUM
 
     channel: ChaseChannel = ChaseChannel.EMAIL
-    due_date: Optional[datetime] = None
+    due_date: Optional[date] = None
     last_contacted: Optional[datetime] = None
     follow_up_count: int = 0
 
@@ -72,6 +79,81 @@ class ChaseItem(BaseModel):
     extra: Dict[str, Any] = {}
 
 
+class ChaseTaskRecord(TypedDict):
+    """
+    Plain-dict form of ChaseItem, as produced by build_tasks and stored in
+    doc_tasks.json. Validated a whole list at a time through CHASE_TASKS,
+    which runs in pydantic-core without building a model per task.
+    Extra keys (e.g. next_state from the chaser) are kept as-is.
+    """
+    __pydantic_config__ = ConfigDict(extra="allow")
+
+    client_id: NotRequired[Optional[str]]
+    client_name: NotRequired[Optional[str]]
+    item_name: str
+    required_for: AdviceStage
+    target: ChaseTarget
+    provider: NotRequired[Optional[str]]
+    status: NotRequired[ChaseStatus]
+    priority: NotRequired[ChasePriority]
+    channel: NotRequired[ChaseChannel]
+    due_date: NotRequired[Optional[date]]
+    reason: NotRequired[Optional[str]]
+    source_doc: NotRequired[Optional[str]]
+
+
+CHASE_TASKS = TypeAdapter(List[ChaseTaskRecord])
+# one model per ChaseTaskRecord field, for column-at-a-time validation;
+# errors read "<field>.<i>" like the row validation's
+_TASK_FIELD_VALUES = {
+    name: create_model("ChaseTaskColumn", **{name: (List[tp], ...)})
+    for name, tp in get_type_hints(ChaseTaskRecord).items()
+}
+
+
+@contextmanager
+def gc_paused():
+    """
+    Turn the cyclic GC off for the block. A bulk call allocates one acyclic
+    dict per task, and GC passes over them cost about as much as the
+    validation itself. The switch is process-wide, so this is for
+    single-threaded scripts (benchmarks, CLIs) only, never for code that
+    runs on API workers.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def validate_tasks(tasks: List[dict]) -> List[ChaseTaskRecord]:
+    """Validate a list of task dicts in one pass. Raises pydantic.ValidationError."""
+    return CHASE_TASKS.validate_python(tasks)
+
+
+def validate_task_values(field: str, values: Sequence) -> None:
+    """
+    Validate the distinct values of one task column (None standing for a
+    missing value) against ChaseTaskRecord. Extra fields are not checked.
+    Raises pydantic.ValidationError.
+    """
+    model = _TASK_FIELD_VALUES.get(field)
+    if model is not None:
+        model.model_validate({field: list(values)})
+
+
+def parse_tasks_json(raw) -> List[ChaseTaskRecord]:
+    """Parse and validate a JSON task list without an intermediate json.loads."""
+    return CHASE_TASKS.validate_json(raw)
+
+
+def dump_tasks_json(tasks: List[ChaseTaskRecord], indent: Optional[int] = None) -> bytes:
+    return CHASE_TASKS.dump_json(tasks, indent=indent)
+
+
 
 class Pension(BaseModel):
     provider_name: str
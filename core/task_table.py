@@ -0,0 +1,347 @@
+"""
+Column-oriented, string-interned task container.
+
+Every task field is an enum-like or heavily repeated string (client names,
+reasons, due dates shared by a client's whole task set), so each column is a
+uint32 array of codes into a per-column StringPool. A million tasks cost
+~4 bytes per field instead of a dict per task.
+
+TaskView is a (table, row indices) pair: filtering and grouping only ever
+build index arrays, the column data is shared. Rows are materialised as dicts
+in the usual task shape only when iterated or serialised.
+"""
+import json
+from array import array
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.schemas import parse_tasks_json, validate_task_values
+
+TASK_FIELDS = (
+    "client_id",
+    "client_name",
+    "item_name",
+    "required_for",
+    "target",
+    "provider",
+    "status",
+    "priority",
+    "channel",
+    "due_date",
+    "reason",
+    "source_doc",
+)
+
+ROW_CHUNK = 4096
+
+
+class StringPool:
+    """Interns strings to dense uint32 codes. Code 0 is reserved for None."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self, values: Iterable[Optional[str]] = ()):
+        self.values: List[Optional[str]] = [None]
+        self._codes: Dict[Optional[str], int] = {None: 0}
+        for v in values:
+            self.code(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code: int) -> Optional[str]:
+        return self.values[code]
+
+    def code(self, value: Optional[str]) -> int:
+        c = self._codes.get(value)
+        if c is None:
+            c = len(self.values)
+            self.values.append(value)
+            self._codes[value] = c
+        return c
+
+    def lookup(self, value: Optional[str]) -> int:
+        """Code for value, or -1 if the pool has never seen it."""
+        return self._codes.get(value, -1)
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _as_codes(data) -> np.ndarray:
+    if isinstance(data, array):
+        return np.frombuffer(data, dtype=np.uint32) if len(data) else np.zeros(0, np.uint32)
+    return np.asarray(data, dtype=np.uint32)
+
+
+class TaskTable:
+    def __init__(
+        self,
+        fields: Sequence[str] = TASK_FIELDS,
+        pools: Optional[Dict[str, StringPool]] = None,
+        columns: Optional[Dict[str, np.ndarray]] = None,
+        indexes: Optional[Dict[str, "GroupIndex"]] = None,
+    ):
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.pools = pools or {f: StringPool() for f in self.fields}
+        self.columns = columns or {f: np.zeros(0, np.uint32) for f in self.fields}
+        # prebuilt group_by results for the whole table (see build_index)
+        self.indexes: Dict[str, GroupIndex] = indexes or {}
+
+    @classmethod
+    def from_dicts(cls, tasks: Iterable[dict], fields: Sequence[str] = TASK_FIELDS) -> "TaskTable":
+        """
+        Build a table from task dicts. Consumes the iterable one row at a time,
+        so a generator never has more than one dict alive. Keys outside
+        `fields` are appended as extra columns in first-seen order.
+        """
+        fields = list(fields)
+        pools = {f: StringPool() for f in fields}
+        codes = {f: array("I") for f in fields}
+        n = 0
+
+        for t in tasks:
+            for k in t.keys():
+                if k not in pools:
+                    fields.append(k)
+                    pools[k] = StringPool()
+                    codes[k] = array("I", bytes(4 * n))
+            for f in fields:
+                v = t.get(f)
+                codes[f].append(pools[f].code(_text(v)))
+            n += 1
+
+        return cls(fields, pools, {f: _as_codes(codes[f]) for f in fields})
+
+    @classmethod
+    def from_json(cls, raw) -> "TaskTable":
+        """Parse and validate a JSON task list (see core.schemas.CHASE_TASKS)."""
+        return cls.from_dicts(parse_tasks_json(raw))
+
+    # ---------- size / access ----------
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]]) if self.fields else 0
+
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.columns.values())
+
+    def codes(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
+    def values(self, field: str) -> List[Optional[str]]:
+        pool = self.pools[field].values
+        return [pool[c] for c in self.columns[field].tolist()]
+
+    def row(self, i: int) -> dict:
+        return {f: self.pools[f].values[self.columns[f][i]] for f in self.fields}
+
+    def _rows(self, idx: Optional[np.ndarray], chunk_size: int = ROW_CHUNK) -> Iterator[dict]:
+        """Decode rows chunk_size at a time, so iteration never decodes the whole table at once."""
+        fields = self.fields
+        n = len(self) if idx is None else len(idx)
+        for start in range(0, n, chunk_size):
+            rows = slice(start, start + chunk_size) if idx is None else idx[start:start + chunk_size]
+            decoded = []
+            for f in fields:
+                pool = self.pools[f].values
+                decoded.append([pool[c] for c in self.columns[f][rows].tolist()])
+            for values in zip(*decoded):
+                yield dict(zip(fields, values))
+
+    def __iter__(self) -> Iterator[dict]:
+        return self._rows(None)
+
+    def to_dicts(self) -> List[dict]:
+        return list(self)
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        """
+        Same text as json.dumps(self.to_dicts(), indent=indent, ensure_ascii=False).
+        Every pool value is encoded once and rows are joined from those
+        fragments (json.dumps with an indent is the pure-Python encoder).
+        """
+        return _rows_json(self, None, indent)
+
+    def validate(self):
+        """
+        Check the book against core.schemas.ChaseTaskRecord without building
+        row dicts: each column's distinct values (including None, if any row
+        lacks one) are validated once. Same outcome as validate_tasks on
+        to_dicts(). Raises pydantic.ValidationError.
+        """
+        for field in self.fields:
+            values = self.pools[field].values
+            used = np.flatnonzero(np.bincount(self.columns[field], minlength=len(values)))
+            validate_task_values(field, [values[c] for c in used.tolist()])
+
+    # ---------- views ----------
+
+    def view(self, rows=None) -> "TaskView":
+        if rows is None:
+            rows = np.arange(len(self), dtype=np.int64)
+        return TaskView(self, np.asarray(rows, dtype=np.int64))
+
+    def filter(self, **equals) -> "TaskView":
+        return self.view().filter(**equals)
+
+    def group_by(self, field: str) -> Dict[Optional[str], "TaskView"]:
+        index = self.indexes.get(field)
+        if index is None:
+            return self.view().group_by(field)
+        return index.views(self)
+
+    def build_index(self, field: str) -> "GroupIndex":
+        """Precompute group_by(field); later group_by calls reuse it."""
+        index = self.view().group_index(field)
+        self.indexes[field] = index
+        return index
+
+    # ---------- derived tables ----------
+
+    def with_columns(self, **new_columns) -> "TaskTable":
+        """
+        Return a table with extra (or replaced) columns. Existing columns and
+        pools are shared, not copied. A value is either a sequence of strings
+        (one per row) or a ready-made (StringPool, codes) pair.
+        """
+        fields = list(self.fields)
+        pools = dict(self.pools)
+        columns = dict(self.columns)
+        for name, data in new_columns.items():
+            if isinstance(data, tuple) and len(data) == 2 and isinstance(data[0], StringPool):
+                pool, codes = data
+            else:
+                pool = StringPool()
+                codes = [pool.code(_text(v)) for v in data]
+            codes = np.asarray(codes, dtype=np.uint32)
+            if len(codes) != len(self):
+                raise ValueError(f"column {name!r} has {len(codes)} rows, table has {len(self)}")
+            if name not in pools:
+                fields.append(name)
+            pools[name] = pool
+            columns[name] = codes
+        indexes = {f: ix for f, ix in self.indexes.items() if f not in new_columns}
+        return TaskTable(fields, pools, columns, indexes)
+
+
+def _rows_json(table: "TaskTable", idx: Optional[np.ndarray], indent: Optional[int]) -> str:
+    fields = table.fields
+    n = len(table) if idx is None else len(idx)
+    if not n or not fields:
+        return json.dumps([{}] * n, indent=indent)
+    fragments = []
+    for f in fields:
+        key = json.dumps(f, ensure_ascii=False) + ": "
+        fragments.append([key + json.dumps(v, ensure_ascii=False) for v in table.pools[f].values])
+
+    if indent is None:
+        item_sep, open_row, close_row, row_sep, open_list, close_list = ", ", "{", "}", ", ", "[", "]"
+    else:
+        pad = " " * indent
+        item_sep = ",\n" + pad * 2
+        open_row, close_row = "{\n" + pad * 2, "\n" + pad + "}"
+        row_sep, open_list, close_list = ",\n" + pad, "[\n" + pad, "\n]"
+
+    rows = []
+    for start in range(0, n, ROW_CHUNK):
+        sel = slice(start, start + ROW_CHUNK) if idx is None else idx[start:start + ROW_CHUNK]
+        decoded = []
+        for f, frag in zip(fields, fragments):
+            decoded.append([frag[c] for c in table.columns[f][sel].tolist()])
+        rows.extend(open_row + item_sep.join(values) + close_row for values in zip(*decoded))
+    return open_list + row_sep.join(rows) + close_list
+
+
+class GroupIndex:
+    """
+    Rows of a table grouped by one field: group k is field code keys[k] and
+    rows[bounds[k]:bounds[k + 1]]. Groups are in order of first appearance.
+    """
+
+    __slots__ = ("field", "keys", "rows", "bounds")
+
+    def __init__(self, field: str, keys: np.ndarray, rows: np.ndarray, bounds: np.ndarray):
+        self.field = field
+        self.keys = keys
+        self.rows = rows
+        self.bounds = bounds
+
+    def views(self, table: "TaskTable") -> Dict[Optional[str], "TaskView"]:
+        pool = table.pools[self.field].values
+        b = self.bounds.tolist()
+        return {
+            pool[k]: TaskView(table, self.rows[b[i]:b[i + 1]])
+            for i, k in enumerate(self.keys.tolist())
+        }
+
+
+class TaskView:
+    """A subset of a TaskTable's rows. Holds indices only."""
+
+    __slots__ = ("table", "rows")
+
+    def __init__(self, table: TaskTable, rows: np.ndarray):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.table._rows(self.rows)
+
+    def to_dicts(self) -> List[dict]:
+        return list(self)
+
+    def codes(self, field: str) -> np.ndarray:
+        return self.table.columns[field][self.rows]
+
+    def values(self, field: str) -> List[Optional[str]]:
+        pool = self.table.pools[field].values
+        return [pool[c] for c in self.codes(field).tolist()]
+
+    def filter(self, **equals) -> "TaskView":
+        """Rows whose field equals the value (or is in the list/tuple/set given)."""
+        mask = np.ones(len(self.rows), dtype=bool)
+        for field, wanted in equals.items():
+            pool = self.table.pools[field]
+            col = self.codes(field)
+            if isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted_codes = [pool.lookup(w) for w in wanted]
+                mask &= np.isin(col, [c for c in wanted_codes if c >= 0])
+            else:
+                mask &= col == pool.lookup(wanted)
+        return TaskView(self.table, self.rows[mask])
+
+    def group_by(self, field: str) -> Dict[Optional[str], "TaskView"]:
+        """Split into views keyed by field value, in order of first appearance."""
+        return self.group_index(field).views(self.table)
+
+    def group_index(self, field: str) -> GroupIndex:
+        col = self.codes(field)
+        if not len(col):
+            empty = np.zeros(0, np.int64)
+            return GroupIndex(field, np.zeros(0, np.uint32), empty, np.zeros(1, np.int64))
+
+        uniq, first, inverse = np.unique(col, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # renumber groups by first appearance so rows come out grouped in that order
+        appearance = np.argsort(first, kind="stable")
+        rank = np.empty_like(appearance)
+        rank[appearance] = np.arange(len(appearance))
+        order = np.argsort(rank[inverse], kind="stable")
+        counts = np.bincount(rank[inverse], minlength=len(uniq))
+        bounds = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return GroupIndex(field, uniq[appearance].astype(np.uint32), self.rows[order], bounds)
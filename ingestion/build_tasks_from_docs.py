@@ -1,20 +1,31 @@
-import json
 from pathlib import Path
 import hashlib
 from datetime import datetime, timedelta
+from typing import Callable, List, Optional
 
+from chaser.dispatch import SENT_LEDGER, SentLedger
+from chaser.run_doc_chaser import CHANGES_PATH, OUT_PATH, annotate_next_states, feed_book
+from core.change_feed import ChangeLog
+from core.generations import SNAPSHOT_NAME, TASKS_NAME, UPDATED_NAME, GenerationStore, StaleGenerationError
+from core.task_table import TaskTable
+from ingestion.dedupe import dedupe_docs
 from ingestion.docx_reader import load_source_docs
+from ingestion.extraction_store import ExtractionStore
+from ingestion.snapshot import file_stamp, write_snapshot
 from ingestion.extractor import (
     guess_client_name,
+    guess_advisor_name,
+    guess_firm_name,
+    guess_provider,
     find_any_date,
     parse_date_hint,
     extract_presence,
-    build_tasks,
+    presence_to_bits,
 )
+from ingestion.task_rules import build_task_table
 
-OUT_EXTRACTED = Path("data/extracted")
-OUT_TASKS = Path("data/doc_tasks.json")
-OUT_EXTRACTED.mkdir(parents=True, exist_ok=True)
+OUT_EXTRACTED = Path("data/extracted.store")
+OUT_GENERATIONS = Path("data/generations")
 
 def make_client_id(file_name: str) -> str:
     h = hashlib.md5(file_name.encode("utf-8")).hexdigest()[:4].upper()
@@ -30,40 +41,84 @@ def sane_anchor_date(anchor):
         return None
     return anchor
 
-if __name__ == "__main__":
-    docs = load_source_docs("data/source_docs")
-    all_tasks = []
+def extract_document(doc: dict) -> dict:
+    """Turn a loaded source doc into the extraction record we persist."""
+    text = doc["text"]
+    file_name = doc["file_name"]
+
+    client_id = make_client_id(file_name)
+    client_name = guess_client_name(text) or file_name.replace(".docx", "")
 
-    for d in docs:
-        text = d["text"]
-        file_name = d["file_name"]
+    date_hint = find_any_date(text)
+    anchor = sane_anchor_date(parse_date_hint(date_hint))
+    presence = extract_presence(text)
 
-        client_id = make_client_id(file_name)
-        client_name = guess_client_name(text) or file_name.replace(".docx", "")
+    return {
+        "client_id": client_id,
+        "client_name": client_name,
+        "advisor": guess_advisor_name(text),
+        "firm": guess_firm_name(text),
+        "provider": guess_provider(text),
+        "source_file": file_name,
+        "date_hint": date_hint,
+        "anchor_date": anchor.date().isoformat() if anchor else None,
+        "presence": presence,
+        "presence_bits": presence_to_bits(presence),
+    }
 
-        date_hint = find_any_date(text)
-        anchor = sane_anchor_date(parse_date_hint(date_hint))
+def publish_book(store: GenerationStore, extracted: List[dict], log: Optional[ChangeLog] = None,
+                 ledger_path=SENT_LEDGER, fallback: Optional[Callable[[], Optional[TaskTable]]] = None,
+                 attempts: int = 3):
+    """
+    Build the book for `extracted`, with the chases the sent ledger records
+    kept sent, commit it as a new generation of `store` and record the
+    transitions from the book it replaces in `log`. Starts over if another
+    commit lands first, so the change feed always diffs against the
+    generation this one was built on. `fallback` gives the previous
+    annotated book when the store has no generation yet.
+    Returns (table, generation).
+    """
+    built = build_task_table(extracted)
+    for attempt in range(attempts):
+        base = store.current()
+        if base is not None:
+            previous = feed_book(base)
+        else:
+            previous = fallback() if fallback is not None else None
+        # re-read each time: a dispatch may have recorded sends meanwhile
+        table = SentLedger.load(ledger_path).apply(built)
+        annotated = annotate_next_states(table)
+        try:
+            with store.begin(base=base) as gen:
+                gen.write_text(TASKS_NAME, table.to_json(indent=2))
+                write_snapshot(gen.path(SNAPSHOT_NAME), table, extracted,
+                               source=file_stamp(gen.path(TASKS_NAME)))
+                gen.write_text(UPDATED_NAME, annotated.to_json(indent=2))
+        except StaleGenerationError:
+            if attempt == attempts - 1:
+                raise
+            continue
+        if log is not None:
+            log.record(previous, annotated)
+        return table, gen.generation
 
-        presence = extract_presence(text)
 
-        extracted = {
-            "client_id": client_id,
-            "client_name": client_name,
-            "source_file": file_name,
-            "date_hint": date_hint,
-            "anchor_date": anchor.date().isoformat() if anchor else None,
-            "presence": presence
-        }
+def _legacy_book() -> Optional[TaskTable]:
+    return TaskTable.from_json(OUT_PATH.read_text(encoding="utf-8")) if OUT_PATH.exists() else None
 
-        (OUT_EXTRACTED / f"{client_id}.json").write_text(
-            json.dumps(extracted, indent=2),
-            encoding="utf-8"
-        )
 
-        tasks = build_tasks(client_id, client_name, file_name, presence, anchor)
-        all_tasks.extend(tasks)
+if __name__ == "__main__":
+    docs, duplicates = dedupe_docs(load_source_docs("data/source_docs"))
+    for canonical, copies in duplicates.items():
+        print(f"{canonical}: skipping near-duplicates {copies}")
+    all_extracted = [extract_document(d) for d in docs]
 
-        print(f"{file_name} -> {len(tasks)} tasks (anchor={extracted['anchor_date']})")
+    ExtractionStore(OUT_EXTRACTED).write_batch(all_extracted)
+    table, generation = publish_book(GenerationStore(OUT_GENERATIONS), all_extracted,
+                                     log=ChangeLog(CHANGES_PATH), fallback=_legacy_book)
+    per_client = {cid: len(v) for cid, v in table.group_by("client_id").items()}
 
-    OUT_TASKS.write_text(json.dumps(all_tasks, indent=2), encoding="utf-8")
-    print(f"\nSaved {len(all_tasks)} tasks to {OUT_TASKS}")
+    for e in all_extracted:
+        n = per_client.get(e["client_id"], 0)
+        print(f"{e['source_file']} -> {n} tasks (anchor={e['anchor_date']})")
+    print(f"\nSaved {len(table)} tasks to {generation.path(TASKS_NAME)}")
@@ -0,0 +1,137 @@
+"""
+Near-duplicate source document detection (MinHash + LSH).
+
+The same fact-find often gets uploaded twice under different file names
+("Sarah Thompson FactFind .docx", "Sarah Thompson.docx"). Each copy would get
+its own client id, embedding and task set, so ingestion keeps one canonical
+document per cluster of near-identical texts.
+
+Text is normalised (case, punctuation, whitespace) and cut into word
+shingles. Each document gets a MinHash signature; signatures are split into
+LSH bands and documents sharing any band bucket become candidate pairs. A
+candidate pair is a duplicate if its estimated Jaccard similarity is at least
+`threshold`. Duplicates are clustered transitively. Texts shorter than one
+shingle (empty files, a lone heading) say nothing about their content and
+are never treated as duplicates.
+
+The copy kept is the earliest one on disk. Client ids are derived from the
+file name, so keeping the first upload means a later copy (or an edit that
+adds a line to it) never moves a client's tasks, feed history or vectors to
+a new id.
+"""
+import itertools
+import os
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 16            # 16 bands x 8 rows: pairs above ~0.7 similarity become candidates
+SHINGLE_WORDS = 5
+THRESHOLD = 0.85
+MIN_WORDS = SHINGLE_WORDS   # shorter texts are left out of clustering
+
+_SHIFT = np.uint64(32)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    words = normalize_text(text)
+    if len(words) < k:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    return np.unique(hashes)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        # multiply-shift hashing: (a*x + b mod 2**64) >> 32, a odd
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> np.ndarray:
+        x = shingle_hashes(text)
+        if not len(x):
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            h = (self.a[:, None] * x[None, :] + self.b[:, None]) >> _SHIFT
+        return h.min(axis=1)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        return np.stack([self.signature(t) for t in texts]) if len(texts) else np.zeros((0, self.num_perm), np.uint64)
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def duplicate_clusters(texts: Sequence[str], threshold: float = THRESHOLD,
+                       bands: int = BANDS, hasher: MinHasher = None) -> List[List[int]]:
+    """
+    Clusters (lists of indices into texts) with more than one member. Texts
+    with fewer than MIN_WORDS words are never put in a cluster.
+    """
+    hasher = hasher or MinHasher()
+    eligible = [i for i, t in enumerate(texts) if len(normalize_text(t)) >= MIN_WORDS]
+    sigs = hasher.signatures([texts[i] for i in eligible])
+    n = len(sigs)
+    rows = hasher.num_perm // bands
+    parent = list(range(n))
+
+    checked = set()
+    for band in range(bands):
+        chunk = sigs[:, band * rows:(band + 1) * rows]
+        buckets: Dict[bytes, List[int]] = {}
+        for i in range(n):
+            buckets.setdefault(chunk[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            for i, j in itertools.combinations(members, 2):
+                if (i, j) in checked or _find(parent, i) == _find(parent, j):
+                    continue
+                checked.add((i, j))
+                if float(np.mean(sigs[i] == sigs[j])) >= threshold:
+                    parent[_find(parent, j)] = _find(parent, i)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(n):
+        clusters.setdefault(_find(parent, i), []).append(eligible[i])
+    return [c for c in clusters.values() if len(c) > 1]
+
+
+def _age_key(doc: dict):
+    """Sort key putting the earliest file first; file name breaks ties (and stands in without a file)."""
+    try:
+        mtime = os.stat(doc["file_path"]).st_mtime_ns
+    except (KeyError, OSError):
+        mtime = 0
+    return mtime, doc["file_name"]
+
+
+def dedupe_docs(docs: Sequence[dict], threshold: float = THRESHOLD) -> Tuple[List[dict], Dict[str, List[str]]]:
+    """
+    Keep one document per near-duplicate cluster (the earliest file, then the
+    first file name). Returns (canonical docs in input order,
+    {canonical file_name: [duplicate file_names]}).
+    """
+    docs = list(docs)
+    dropped = set()
+    duplicates: Dict[str, List[str]] = {}
+    for cluster in duplicate_clusters([d.get("text", "") for d in docs], threshold):
+        keep = min(cluster, key=lambda i: _age_key(docs[i]))
+        others = [i for i in cluster if i != keep]
+        dropped.update(others)
+        duplicates[docs[keep]["file_name"]] = [docs[i]["file_name"] for i in others]
+    return [d for i, d in enumerate(docs) if i not in dropped], duplicates
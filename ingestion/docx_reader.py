@@ -1,8 +1,105 @@
+import zipfile
+import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import Iterator
+
 from docx import Document
 
-def read_docx_text(path: str) -> str:
-    """Extract plain text from a .docx file."""
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+W_BODY = W_NS + "body"
+W_P = W_NS + "p"
+W_T = W_NS + "t"
+W_TAB = W_NS + "tab"
+W_BR = W_NS + "br"
+W_CR = W_NS + "cr"
+W_TBL = W_NS + "tbl"
+W_TR = W_NS + "tr"
+W_TC = W_NS + "tc"
+
+
+def iter_docx_blocks(path: str) -> Iterator[str]:
+    """
+    Stream text blocks out of word/document.xml in document order.
+
+    Paragraphs come out one per block. Each table row comes out as one block
+    with its cells joined by " | " (nested tables are folded into their cell).
+    Only the document part is decompressed; media parts are never read.
+    """
+    with zipfile.ZipFile(path) as zf:
+        with zf.open("word/document.xml") as xml_file:
+            body = None
+            para_bufs = []      # one text buffer per open <w:p> (text boxes nest)
+            tables = []         # per open <w:tbl>: list of cells of the current row
+            cell_parts = []     # per open <w:tc>: paragraph texts in that cell
+            fallback_depth = 0  # skip mc:Fallback copies of mc:Choice content
+
+            for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                tag = elem.tag
+
+                if event == "start":
+                    if tag == W_P:
+                        para_bufs.append([])
+                    elif tag == W_TBL:
+                        tables.append([])
+                    elif tag == W_TR:
+                        tables[-1] = []
+                    elif tag == W_TC:
+                        cell_parts.append([])
+                    elif tag == MC_FALLBACK:
+                        fallback_depth += 1
+                    elif tag == W_BODY:
+                        body = elem
+                    continue
+
+                if tag == MC_FALLBACK:
+                    fallback_depth -= 1
+                    continue
+
+                if tag in (W_T, W_TAB, W_BR, W_CR):
+                    if para_bufs and not fallback_depth:
+                        if tag == W_T:
+                            para_bufs[-1].append(elem.text or "")
+                        elif tag == W_TAB:
+                            para_bufs[-1].append("\t")
+                        else:
+                            para_bufs[-1].append("\n")
+                    continue
+
+                if tag == W_P:
+                    text = "".join(para_bufs.pop()).strip()
+                    if not text or fallback_depth:
+                        continue
+                    if para_bufs:
+                        # paragraph inside a text box: keep it with its host paragraph
+                        para_bufs[-1].append(" " + text)
+                    elif cell_parts:
+                        cell_parts[-1].append(text)
+                    else:
+                        yield text
+                elif tag == W_TC:
+                    cell = " ".join(cell_parts.pop())
+                    if tables:
+                        tables[-1].append(cell)
+                elif tag == W_TR:
+                    row = " | ".join(c for c in tables[-1] if c)
+                    if not row:
+                        continue
+                    if len(tables) > 1 and cell_parts:
+                        cell_parts[-1].append(row)
+                    else:
+                        yield row
+                elif tag == W_TBL:
+                    tables.pop()
+
+                # Top-level block finished: drop it so memory stays flat.
+                if body is not None and not para_bufs and not tables and tag in (W_P, W_TBL):
+                    body.clear()
+
+
+def read_docx_text_python_docx(path: str) -> str:
+    """Extract paragraph text via the full python-docx object model."""
     doc = Document(path)
     parts = []
     for p in doc.paragraphs:
@@ -11,6 +108,16 @@ def read_docx_text(path: str) -> str:
             parts.append(t)
     return "\n".join(parts)
 
+
+def read_docx_text(path: str) -> str:
+    """Extract plain text (paragraphs and table rows) from a .docx file."""
+    try:
+        return "\n".join(iter_docx_blocks(path))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        # malformed package or XML: let python-docx have a go
+        return read_docx_text_python_docx(path)
+
+
 def load_source_docs(folder: str = "data/source_docs"):
     """Return list of {file_name, file_path, text} for all .docx in folder."""
     folder_path = Path(folder)
@@ -0,0 +1,313 @@
+"""
+Single-file store for per-document extraction results.
+
+Replaces one pretty-printed data/extracted/<client_id>.json per document.
+
+Layout (for a store at data/extracted.store):
+
+    data/extracted.store       append-only records:
+                               <u32 payload_len><u32 presence_bits><compact JSON payload>
+    data/extracted.store.idx   header + flag names + columns:
+                               offsets (u64), presence_bits (u32), client ids
+
+The presence flags are packed one bit per flag (see extractor.PRESENCE_FLAGS),
+and the bit column is duplicated in the index so analytics over flags never
+touch the record file. A batch is appended and fsynced, then a new index is
+written to a temp file and renamed over the old one: readers see either the
+whole batch or none of it. Bytes past the indexed length are a torn batch and
+are truncated by the next writer. Writers (threads or processes) take an
+flock on <store>.lock around refresh -> append -> index replace; readers
+never lock.
+"""
+import fcntl
+import json
+import os
+import struct
+import tempfile
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ingestion.extractor import PRESENCE_FLAGS, bits_to_presence, presence_to_bits
+
+MAGIC = b"AIXS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIQ")   # magic, version, n_flags, count, data_len
+_RECORD = struct.Struct("<II")       # payload_len, presence_bits
+_LEN = struct.Struct("<I")
+
+SCALAR_FIELDS = (
+    "client_id", "client_name", "advisor", "firm", "provider", "source_file", "date_hint", "anchor_date",
+)
+
+DEFAULT_STORE = Path("data/extracted.store")
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ExtractionStore:
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self.flag_names: List[str] = list(PRESENCE_FLAGS)
+        self.data_len = 0
+        self._ids: List[str] = []
+        self._offsets = array("Q")
+        self._bits = array("I")
+        self._row: Dict[str, int] = {}
+        self._index_stat = None
+
+    # ---------- index ----------
+
+    def refresh(self):
+        """(Re)load the index if it changed on disk since the last load."""
+        try:
+            st = self.index_path.stat()
+        except FileNotFoundError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp == self._index_stat:
+            return
+
+        raw = self.index_path.read_bytes()
+        magic, version, n_flags, count, data_len = _HEADER.unpack_from(raw, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.index_path} is not a v{VERSION} extraction store index")
+        pos = _HEADER.size
+
+        (n,) = _LEN.unpack_from(raw, pos)
+        pos += _LEN.size
+        flag_names = json.loads(raw[pos:pos + n].decode("utf-8"))
+        pos += n
+
+        offsets = array("Q")
+        offsets.frombytes(raw[pos:pos + 8 * count])
+        pos += 8 * count
+
+        bits = array("I")
+        bits.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+
+        (n,) = _LEN.unpack_from(raw, pos)
+        pos += _LEN.size
+        ids = raw[pos:pos + n].decode("utf-8").split("\n") if count else []
+
+        if len(flag_names) != n_flags or len(ids) != count:
+            raise ValueError(f"{self.index_path} is corrupt")
+
+        self.flag_names = flag_names
+        self.data_len = data_len
+        self._ids = ids
+        self._offsets = offsets
+        self._bits = bits
+        self._row = {cid: i for i, cid in enumerate(ids)}
+        self._index_stat = stamp
+
+    def _write_index(self, ids, offsets, bits, data_len):
+        names = json.dumps(self.flag_names, separators=(",", ":")).encode("utf-8")
+        id_blob = "\n".join(ids).encode("utf-8")
+
+        fd, tmp = tempfile.mkstemp(prefix=self.index_path.name + ".", suffix=".tmp",
+                                   dir=self.index_path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(self.flag_names), len(ids), data_len))
+            f.write(_LEN.pack(len(names)))
+            f.write(names)
+            f.write(offsets.tobytes())
+            f.write(bits.tobytes())
+            f.write(_LEN.pack(len(id_blob)))
+            f.write(id_blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)        # mkstemp creates it 0600
+        os.replace(tmp, self.index_path)
+        _fsync_dir(self.index_path.parent)
+
+    # ---------- writes ----------
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive writer lock, held across threads and processes."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def write_batch(self, records: Iterable[dict]) -> int:
+        """
+        Append extraction dicts (the shape /run produces) as one atomic batch.
+        A record for an existing client_id supersedes the old one; a record
+        identical to the stored one is skipped, so re-running /run over the
+        same documents does not grow the file. Returns the number appended.
+        """
+        with self._writing():
+            return self._write_batch(records)
+
+    def _write_batch(self, records: Iterable[dict]) -> int:
+        self.refresh()
+        if self.flag_names != list(PRESENCE_FLAGS):
+            raise ValueError(
+                "Presence flags changed since this store was written; "
+                "rebuild it with `python -m ingestion.extraction_store compact`"
+            )
+
+        ids = list(self._ids)
+        offsets = array("Q", self._offsets)
+        bits = array("I", self._bits)
+        row = dict(self._row)
+
+        written = 0
+        with open(self.path, "ab+") as f:
+            f.truncate(self.data_len)      # drop any torn tail from a crashed writer
+            pos = self.data_len
+            chunks = []
+            latest: Dict[str, bytes] = {}  # records already in this batch
+            for rec in records:
+                payload = json.dumps(
+                    {k: rec.get(k) for k in SCALAR_FIELDS},
+                    separators=(",", ":"),
+                    ensure_ascii=False,
+                ).encode("utf-8")
+                b = presence_to_bits(rec.get("presence", {}), self.flag_names)
+                record = _RECORD.pack(len(payload), b) + payload
+
+                cid = rec["client_id"]
+                previous = latest.get(cid)
+                if previous is None and cid in row:
+                    f.seek(offsets[row[cid]])
+                    previous = f.read(len(record))
+                if previous == record:
+                    # unchanged since the last run: don't grow the file with a copy
+                    continue
+                latest[cid] = record
+                chunks.append(record)
+
+                if cid in row:
+                    i = row[cid]
+                    offsets[i] = pos
+                    bits[i] = b
+                else:
+                    row[cid] = len(ids)
+                    ids.append(cid)
+                    offsets.append(pos)
+                    bits.append(b)
+                pos += len(record)
+                written += 1
+
+            if not chunks:
+                return 0
+            f.seek(self.data_len)
+            f.write(b"".join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._write_index(ids, offsets, bits, pos)
+        self.refresh()
+        return written
+
+    # ---------- reads ----------
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, client_id):
+        return client_id in self._row
+
+    def client_ids(self) -> List[str]:
+        return list(self._ids)
+
+    def presence_bits(self) -> array:
+        """Packed presence flags for every client, in index order (no record I/O)."""
+        return self._bits
+
+    def _decode(self, payload: bytes, bits: int) -> dict:
+        rec = json.loads(payload)
+        rec["presence"] = bits_to_presence(bits, self.flag_names)
+        if self.flag_names == list(PRESENCE_FLAGS):
+            rec["presence_bits"] = bits     # lets task_rules skip re-packing
+        return rec
+
+    def get(self, client_id: str) -> Optional[dict]:
+        i = self._row.get(client_id)
+        if i is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[i])
+            n, b = _RECORD.unpack(f.read(_RECORD.size))
+            return self._decode(f.read(n), b)
+
+    def scan(self) -> Iterator[dict]:
+        """Yield every live record in index order with one sequential file pass."""
+        if not self._ids:
+            return
+        order = sorted(range(len(self._ids)), key=self._offsets.__getitem__)
+        with open(self.path, "rb") as f:
+            for i in order:
+                f.seek(self._offsets[i])
+                n, b = _RECORD.unpack(f.read(_RECORD.size))
+                yield self._decode(f.read(n), b)
+
+    def compact(self):
+        """
+        Rewrite the store with only live records (drops superseded ones and
+        re-packs presence bits under the current PRESENCE_FLAGS). Offline
+        maintenance: readers must not be using the store meanwhile.
+        """
+        with self._writing():
+            self._index_stat = None
+            self.refresh()
+            records = list(self.scan())
+            for p in (self.path, self.index_path):
+                if p.exists():
+                    p.unlink()
+            self._reset()
+            self._write_batch(records)
+
+
+def migrate_json_dir(src_dir="data/extracted", store_path=DEFAULT_STORE) -> int:
+    """Load every <client_id>.json in src_dir into the store as one batch."""
+    records = []
+    for fp in sorted(Path(src_dir).glob("*.json")):
+        records.append(json.loads(fp.read_text(encoding="utf-8")))
+    return ExtractionStore(store_path).write_batch(records)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extraction store utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    m = sub.add_parser("migrate", help="convert a directory of per-client JSON files")
+    m.add_argument("src", nargs="?", default="data/extracted")
+    m.add_argument("store", nargs="?", default=str(DEFAULT_STORE))
+
+    c = sub.add_parser("compact", help="drop superseded records")
+    c.add_argument("store", nargs="?", default=str(DEFAULT_STORE))
+
+    args = parser.parse_args()
+    if args.cmd == "migrate":
+        n = migrate_json_dir(args.src, args.store)
+        print(f"Migrated {n} extraction files into {args.store}")
+    else:
+        store = ExtractionStore(args.store)
+        store.compact()
+        print(f"Compacted {args.store}: {len(store)} live records")
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
 PROVIDERS = [
@@ -145,10 +145,74 @@ def guess_client_name(text: str) -> Optional[str]:
                 return name
     return None
 
+def guess_advisor_name(text: str) -> Optional[str]:
+    m = re.search(r"Advis[eo]r\s*:\s*([^\n\r|,]+)", text, re.IGNORECASE)
+    if m:
+        name = m.group(1).strip()
+        if 3 <= len(name) <= 60:
+            return name
+    return None
+
+def guess_firm_name(text: str) -> Optional[str]:
+    # a "Firm:" / "Advice firm:" / "Practice:" label at the start of a line or cell
+    m = re.search(r"^[ \t|]*(?:Advice\s+|Advisory\s+)?(?:Firm|Practice)\s*:\s*([^\n\r|,]+)",
+                  text, re.IGNORECASE | re.MULTILINE)
+    if m:
+        name = m.group(1).strip()
+        if 2 <= len(name) <= 80:
+            return name
+    return None
+
+def guess_provider(text: str) -> Optional[str]:
+    """The provider (a PROVIDERS name) the document mentions first, if any."""
+    best = None
+    for name in PROVIDERS:
+        m = re.search(r"\b" + re.escape(name) + r"\b", text, re.IGNORECASE)
+        if m and (best is None or m.start() < best[0]):
+            best = (m.start(), name)
+    return best[1] if best else None
+
 def present(text: str, keywords) -> bool:
     t = text.lower()
     return any(k.lower() in t for k in keywords)
 
+PRESENCE_FLAGS = (
+    [f"pre_meeting.{field}" for field in REQUIRED_PRE_MEETING]
+    + [f"pensions.{field}" for field in REQUIRED_PENSIONS]
+    + [
+        "loa",
+        "policy_number_present",
+        "mentions_pension",
+        "mentions_provider",
+        "mentions_children",
+        "mentions_education",
+        "mentions_isa",
+        "isa_remaining_mentioned",
+    ]
+)
+
+def presence_to_bits(presence: dict, flags=PRESENCE_FLAGS) -> int:
+    """Pack a presence dict into an int, bit i = flags[i]."""
+    bits = 0
+    for i, name in enumerate(flags):
+        group, _, field = name.partition(".")
+        value = presence.get(group, {}).get(field) if field else presence.get(group)
+        if value:
+            bits |= 1 << i
+    return bits
+
+def bits_to_presence(bits: int, flags=PRESENCE_FLAGS) -> dict:
+    """Inverse of presence_to_bits; returns the same shape as extract_presence."""
+    presence = {"pre_meeting": {}, "pensions": {}}
+    for i, name in enumerate(flags):
+        group, _, field = name.partition(".")
+        value = bool(bits >> i & 1)
+        if field:
+            presence.setdefault(group, {})[field] = value
+        else:
+            presence[group] = value
+    return presence
+
 def extract_presence(text: str) -> dict:
     presence = {"pre_meeting": {}, "pensions": {}, "loa": False, "policy_number_present": False}
 
@@ -178,122 +242,18 @@ def build_tasks(
     presence: dict,
     anchor_date: Optional[datetime],
 ) -> list:
-    now = datetime.utcnow()
-    base = anchor_date or now
-
-    def due(days_from_base: int) -> str:
-        return (base + timedelta(days=days_from_base)).date().isoformat()
-
-    tasks = []
-
-    for field, ok in presence["pre_meeting"].items():
-        if not ok:
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": f"collect_{field}",
-                "required_for": "pre_advice",
-                "target": "client",
-                "status": "NOT_STARTED",
-                "priority": "high",
-                "channel": "email",
-                "due_date": due(2),
-                "reason": f"Missing {field.replace('_',' ')} required before advice",
-                "source_doc": file_name
-            })
-
-    for field, ok in presence["pensions"].items():
-        if not ok:
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": f"pension_{field}",
-                "required_for": "advice",
-                "target": "provider",
-                "status": "NOT_STARTED",
-                "priority": "high",
-                "channel": "email",
-                "due_date": due(5),
-                "reason": f"Missing pension detail: {field.replace('_',' ')} needed for suitability work",
-                "source_doc": file_name
-            })
-
-    if presence["mentions_children"] and not presence["mentions_education"]:
-        tasks.append({
-            "client_id": client_id,
-            "client_name": client_name,
-            "item_name": "education_planning_check",
-            "required_for": "pre_advice",
-            "target": "advisor",
-            "status": "NOT_STARTED",
-            "priority": "medium",
-            "channel": "dashboard",
-            "due_date": due(7),
-            "reason": "Children mentioned but no education planning captured",
-            "source_doc": file_name
-        })
-
-    if presence["mentions_isa"]:
-        if presence.get("isa_remaining_mentioned"):
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": "isa_allowance_opportunity",
-                "required_for": "annual_review",
-                "target": "advisor",
-                "status": "NOT_STARTED",
-                "priority": "low",
-                "channel": "dashboard",
-                "due_date": due(3),
-                "reason": "ISA allowance appears to be available; proactive outreach opportunity",
-                "source_doc": file_name
-            })
-        else:
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": "isa_allowance_missing_data",
-                "required_for": "annual_review",
-                "target": "client",
-                "status": "NOT_STARTED",
-                "priority": "low",
-                "channel": "email",
-                "due_date": due(10),
-                "reason": "ISA mentioned but remaining/used allowance not captured",
-                "source_doc": file_name
-            })
-
-    missing_pension_fields = sum(1 for v in presence["pensions"].values() if not v)
-
-    if presence["mentions_pension"] and presence["mentions_provider"] and missing_pension_fields <= 3:
-        if not presence["policy_number_present"]:
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": "policy_number_collection",
-                "required_for": "meeting_pack_signoff",
-                "target": "client",
-                "status": "NOT_STARTED",
-                "priority": "high",
-                "channel": "email",
-                "due_date": due(2),
-                "reason": "Policy numbers become mandatory once LOA chasing begins",
-                "source_doc": file_name
-            })
-
-        if not presence["loa"]:
-            tasks.append({
-                "client_id": client_id,
-                "client_name": client_name,
-                "item_name": "loa_pack_request",
-                "required_for": "suitability_final",
-                "target": "provider",
-                "status": "NOT_STARTED",
-                "priority": "high",
-                "channel": "email",
-                "due_date": due(7),
-                "reason": "LOA required near final suitability stage; created only when pension data is largely complete",
-                "source_doc": file_name
-            })
-
-    return tasks
+    """
+    Chase tasks for one document. The rules themselves live in
+    ingestion/task_rules.json; for a whole book use task_rules.build_task_table.
+    """
+    # task_rules depends on PRESENCE_FLAGS above, so import lazily
+    from ingestion.task_rules import build_task_table
+
+    extracted = {
+        "client_id": client_id,
+        "client_name": client_name,
+        "source_file": file_name,
+        "anchor_date": anchor_date,
+        "presence": presence,
+    }
+    return build_task_table([extracted]).to_dicts()
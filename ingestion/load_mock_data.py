@@ -1,21 +1,93 @@
+"""
+Bulk-load a CRM client export (data/mock_clients.json) into the vector store.
+
+    python -m ingestion.load_mock_data [path] [--batch-size 256] [--restart]
+
+The export is a JSON array of clients and can be several GB, so it is never
+loaded whole: clients are decoded one at a time from a sliding buffer, their
+conversations are collected into batches of --batch-size documents, and each
+batch is encoded in one call and upserted. A reader thread keeps parsing the
+next batch while the current one is encoded; at most two batches are queued.
+
+After every committed batch a checkpoint (<path>.checkpoint) records the byte
+offset just past the last client in it. A rerun resumes from there; upserts
+make re-sending a partly written batch harmless. The checkpoint is ignored if
+the export's size or mtime changed since it was written.
+"""
+import codecs
 import json
-from intelligence.vector_store import add_text
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from intelligence.vector_store import date_key, document_firm, get_index
+
+DEFAULT_EXPORT = Path("data/mock_clients.json")
+DEFAULT_BATCH_SIZE = 256
+READ_CHUNK = 1 << 20
 
-print("Starting ingestion...\n")
+_SEPARATORS = " \t\r\n,"
+_decoder = json.JSONDecoder()
 
 
-with open("data/mock_clients.json", "r", encoding="utf-8") as f:
-    clients = json.load(f)
+def iter_json_array(path, start: int = 0, chunk_size: int = READ_CHUNK) -> Iterator[Tuple[dict, int]]:
+    """
+    Yield (element, byte offset just past it) for each element of the top-level
+    JSON array in path. `start` is an offset previously yielded (or 0).
+    Memory is bounded by chunk_size plus the largest single element.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        f.seek(start)
+        text, i = "", 0
+        offset = start            # file offset of text[i]
+        opened = start > 0
+        eof = False
 
+        def fill():
+            nonlocal text, i, eof
+            raw = f.read(chunk_size)
+            eof = not raw
+            text = text[i:] + utf8.decode(raw, final=eof)
+            i = 0
 
-for client in clients:
+        while True:
+            # separators are ASCII, so each one is one byte of offset
+            while True:
+                while i < len(text) and (text[i] in _SEPARATORS or (text[i] == "[" and not opened)):
+                    opened = opened or text[i] == "["
+                    i += 1
+                    offset += 1
+                if i < len(text) or eof:
+                    break
+                fill()
+            if i >= len(text) or text[i] == "]":
+                return
+
+            try:
+                obj, end = _decoder.raw_decode(text, i)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+
+            offset += len(text[i:end].encode("utf-8"))
+            i = end
+            yield obj, offset
+
+
+def conversation_docs(client: dict) -> List[Tuple[str, str, dict]]:
+    """(doc id, text, metadata) for each conversation of one exported client."""
     client_id = client.get("client_id", "unknown_id")
     profile = client.get("profile", {})
     client_name = profile.get("name", "Unknown Client")
+    firm = document_firm(client.get("firm") or profile.get("firm"))
 
-    conversations = client.get("conversations", [])
-
-    for convo in conversations:
+    docs = []
+    for convo in client.get("conversations", []):
         date = convo.get("date", "")
         summary = convo.get("summary", "")
         key_points = convo.get("key_points", [])
@@ -25,21 +97,122 @@ for client in clients:
         else:
             key_points_text = "None"
 
-        
         text = f"""
 Client: {client_name}
 Date: {date}
 Summary: {summary}
 Key Points: {key_points_text}
 """
+        docs.append((
+            f"{client_id}_{date}",
+            text,
+            {
+                "client_id": client_id,
+                "client_name": client_name,
+                "firm": firm,
+                "doc_date": date_key(date),
+            },
+        ))
+    return docs
+
+
+def _source_stamp(path: Path) -> dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def read_checkpoint(checkpoint: Path, export: Path) -> dict:
+    try:
+        state = json.loads(checkpoint.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    return state if state.get("source") == _source_stamp(export) else {}
+
+
+def write_checkpoint(checkpoint: Path, state: dict):
+    tmp = checkpoint.with_name(checkpoint.name + f".tmp{os.getpid()}")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, checkpoint)
+
+
+def _batches(export: Path, start: int, batch_size: int):
+    """Client-aligned batches: (docs, clients in batch, offset after last client)."""
+    docs, clients = [], 0
+    offset = start
+    for client, offset in iter_json_array(export, start):
+        docs.extend(conversation_docs(client))
+        clients += 1
+        if len(docs) >= batch_size:
+            yield docs, clients, offset
+            docs, clients = [], 0
+    if docs or clients:
+        yield docs, clients, offset
+
+
+def load_mock_data(export=DEFAULT_EXPORT, batch_size: int = DEFAULT_BATCH_SIZE,
+                   restart: bool = False) -> dict:
+    export = Path(export)
+    checkpoint = export.with_name(export.name + ".checkpoint")
+    state = {} if restart else read_checkpoint(checkpoint, export)
+    state = {
+        "source": _source_stamp(export),
+        "offset": state.get("offset", 0),
+        "clients": state.get("clients", 0),
+        "documents": state.get("documents", 0),
+    }
+    if state["offset"]:
+        print(f"Resuming after {state['clients']} clients ({state['documents']} documents)")
+
+    index = get_index()
+    pending: "queue.Queue" = queue.Queue(maxsize=2)
+    failure = []
+
+    def reader():
+        try:
+            for batch in _batches(export, state["offset"], batch_size):
+                pending.put(batch)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            pending.put(None)
+
+    threading.Thread(target=reader, name="export-reader", daemon=True).start()
+
+    while True:
+        batch = pending.get()
+        if batch is None:
+            break
+        docs, clients, offset = batch
+        if docs:
+            # a client that repeats a conversation date keeps its last one
+            unique = {d[0]: d for d in docs}
+            ids = list(unique)
+            texts = [unique[i][1] for i in ids]
+            index.upsert(ids, texts, [unique[i][2] for i in ids], index.encode(texts))
+
+        state["offset"] = offset
+        state["clients"] += clients
+        state["documents"] += len(docs)
+        write_checkpoint(checkpoint, state)
+        print(f"Indexed {state['clients']} clients, {state['documents']} conversations")
 
-        
-        doc_id = f"{client_id}_{date}"
+    if failure:
+        raise failure[0]
+    return state
 
-        
-        add_text(doc_id, text, {"client_id": client_id})
 
-    print(f"Indexed conversations for {client_name}")
+if __name__ == "__main__":
+    import argparse
 
-print("\nIngestion complete.")
+    parser = argparse.ArgumentParser(description="Load a CRM client export into the vector store")
+    parser.add_argument("export", nargs="?", default=str(DEFAULT_EXPORT))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint")
+    args = parser.parse_args()
 
+    print("Starting ingestion...\n")
+    load_mock_data(args.export, args.batch_size, args.restart)
+    print("\nIngestion complete.")
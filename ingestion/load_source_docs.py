@@ -1,18 +1,23 @@
 # ingestion/load_source_docs.py
 
 from pathlib import Path
-from ingestion.docx_reader import read_docx_text
-from intelligence.vector_store import add_text
+from ingestion.dedupe import dedupe_docs
+from ingestion.docx_reader import load_source_docs
+from ingestion.extractor import find_any_date, guess_advisor_name, guess_firm_name, parse_date_hint
+from intelligence.vector_store import add_text, date_key, document_firm
 
 
 def ingest_source_docs(folder: str = "data/source_docs"):
-    folder_path = Path(folder)
+    docs, duplicates = dedupe_docs(load_source_docs(folder))
+    for canonical, copies in duplicates.items():
+        print(f"Skipped near-duplicates of {canonical}: {copies}")
 
-    for fp in folder_path.glob("*.docx"):
-        text = read_docx_text(str(fp))
+    for d in docs:
+        text = d["text"]
         if not text.strip():
             continue
 
+        fp = Path(d["file_path"])
         doc_id = fp.stem
 
         add_text(
@@ -21,7 +26,10 @@ def ingest_source_docs(folder: str = "data/source_docs"):
             metadata={
                 "source": fp.name,
                 "file_path": str(fp),
-                "client_name": fp.stem
+                "client_name": fp.stem,
+                "advisor": guess_advisor_name(text),
+                "firm": document_firm(guess_firm_name(text)),
+                "doc_date": date_key(parse_date_hint(find_any_date(text))),
             },
         )
 
@@ -0,0 +1,212 @@
+"""
+Binary warm-start snapshot of a /run: task table, its group indexes and the
+extraction results, in one file that a fresh process memory-maps instead of
+re-parsing doc_tasks.json.
+
+Layout (little-endian):
+
+    header     <4sHHI>  magic b"AISS", version, reserved, manifest_len
+    manifest   compact JSON: fields, section table, source stamp
+    sections   raw arrays, each 8-byte aligned
+
+Every column is a uint32 code array (as in TaskTable); every StringPool is a
+uint64 offsets array plus one UTF-8 blob. Code arrays and group indexes are
+used in place through the mmap, so loading costs one small JSON manifest plus
+decoding the (interned, small) string pools.
+
+A snapshot records the size/mtime of the tasks file it was written next to;
+load_snapshot returns None if that file has changed since, if the version is
+different or if the file is missing, and callers fall back to the JSON.
+"""
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from core.task_table import GroupIndex, StringPool, TaskTable, TaskView
+from ingestion.extraction_store import SCALAR_FIELDS
+from ingestion.extractor import PRESENCE_FLAGS, bits_to_presence, presence_to_bits
+
+MAGIC = b"AISS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_ALIGN = 8
+
+INDEXED_FIELDS = ("client_id", "client_name")
+
+DEFAULT_SNAPSHOT = Path("data/doc_tasks.snapshot")
+
+
+def file_stamp(path) -> Optional[dict]:
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class _SectionWriter:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> int:
+        pad = -self.size % _ALIGN
+        if pad:
+            self.chunks.append(b"\0" * pad)
+            self.size += pad
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        return offset
+
+    def array(self, arr: np.ndarray) -> dict:
+        arr = np.ascontiguousarray(arr)
+        dtype = arr.dtype.newbyteorder("<").str
+        return {"offset": self.add(arr.astype(dtype, copy=False).tobytes()), "count": len(arr), "dtype": dtype}
+
+    def pool(self, pool: StringPool) -> dict:
+        encoded = [v.encode("utf-8") for v in pool.values[1:]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return {"offsets": self.array(offsets), "blob": self.array(np.frombuffer(b"".join(encoded), np.uint8))}
+
+
+def write_snapshot(path, table: TaskTable, extractions: Sequence[dict] = (),
+                   source=None, flags: Sequence[str] = PRESENCE_FLAGS) -> Path:
+    """Write table (with INDEXED_FIELDS group indexes) and extractions atomically."""
+    path = Path(path)
+    w = _SectionWriter()
+
+    columns, pools = {}, {}
+    for f in table.fields:
+        columns[f] = w.array(table.codes(f))
+        pools[f] = w.pool(table.pools[f])
+
+    indexes = {}
+    for f in INDEXED_FIELDS:
+        if f in table.pools:
+            ix = table.indexes.get(f) or table.view().group_index(f)
+            indexes[f] = {"keys": w.array(ix.keys), "rows": w.array(ix.rows), "bounds": w.array(ix.bounds)}
+
+    ext_pools, ext_columns = {}, {}
+    for f in SCALAR_FIELDS:
+        pool = StringPool()
+        codes = np.fromiter((pool.code(e.get(f)) for e in extractions), dtype=np.uint32, count=len(extractions))
+        ext_columns[f] = w.array(codes)
+        ext_pools[f] = w.pool(pool)
+    bits = np.fromiter((presence_to_bits(e.get("presence", {}), flags) for e in extractions),
+                       dtype=np.uint32, count=len(extractions))
+
+    manifest = json.dumps({
+        "source": source,
+        "rows": len(table),
+        "fields": list(table.fields),
+        "columns": columns,
+        "pools": pools,
+        "indexes": indexes,
+        "extractions": {
+            "count": len(extractions),
+            "flags": list(flags),
+            "presence_bits": w.array(bits),
+            "columns": ext_columns,
+            "pools": ext_pools,
+        },
+    }, separators=(",", ":")).encode("utf-8")
+
+    head = _HEADER.pack(MAGIC, VERSION, 0, len(manifest)) + manifest
+    head += b"\0" * (-len(head) % _ALIGN)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with tmp.open("wb") as f:
+        f.write(head)
+        for chunk in w.chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+class Snapshot:
+    """A loaded snapshot. Arrays are views into the mmap, which stays open."""
+
+    def __init__(self, mm: mmap.mmap, base: int, manifest: dict):
+        self._mm = mm
+        self._base = base
+        self.manifest = manifest
+
+        self.table = TaskTable(
+            manifest["fields"],
+            {f: self._pool(d) for f, d in manifest["pools"].items()},
+            {f: self._array(d) for f, d in manifest["columns"].items()},
+            {
+                f: GroupIndex(f, self._array(d["keys"]), self._array(d["rows"]), self._array(d["bounds"]))
+                for f, d in manifest["indexes"].items()
+            },
+        )
+
+        ext = manifest["extractions"]
+        self.flag_names: List[str] = ext["flags"]
+        self._ext_pools = {f: self._pool(d) for f, d in ext["pools"].items()}
+        self._ext_columns = {f: self._array(d) for f, d in ext["columns"].items()}
+        self._presence_bits = self._array(ext["presence_bits"])
+        ids = self._ext_pools["client_id"].values
+        self.client_rows: Dict[str, int] = {
+            ids[c]: i for i, c in enumerate(self._ext_columns["client_id"].tolist())
+        }
+
+    def _array(self, d: dict) -> np.ndarray:
+        return np.frombuffer(self._mm, dtype=np.dtype(d["dtype"]), count=d["count"],
+                             offset=self._base + d["offset"])
+
+    def _pool(self, d: dict) -> StringPool:
+        offsets = self._array(d["offsets"]).tolist()
+        blob = self._array(d["blob"]).tobytes()
+        return StringPool(blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1))
+
+    # ---------- extractions ----------
+
+    def _extraction(self, i: int) -> dict:
+        rec = {f: self._ext_pools[f].values[self._ext_columns[f][i]] for f in self._ext_columns}
+        rec["presence"] = bits_to_presence(int(self._presence_bits[i]), self.flag_names)
+        return rec
+
+    def extraction(self, client_id: str) -> Optional[dict]:
+        i = self.client_rows.get(client_id)
+        return None if i is None else self._extraction(i)
+
+    def extractions(self) -> Iterator[dict]:
+        for i in range(self.manifest["extractions"]["count"]):
+            yield self._extraction(i)
+
+    def tasks_for(self, client_id: str) -> TaskView:
+        return self.table.group_by("client_id").get(client_id) or self.table.view([])
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT, source=None) -> Optional[Snapshot]:
+    """The snapshot at path, or None if it is missing, another version, or stale for `source`."""
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if len(mm) < _HEADER.size:
+        return None
+    magic, version, _, n = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        return None
+    manifest = json.loads(mm[_HEADER.size:_HEADER.size + n])
+    if source is not None and manifest.get("source") != source:
+        return None
+
+    base = _HEADER.size + n
+    base += -base % _ALIGN
+    return Snapshot(mm, base, manifest)
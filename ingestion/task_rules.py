@@ -0,0 +1,255 @@
+"""
+Declarative chase-task rules, compiled to a vectorised evaluator.
+
+Rules live in task_rules.json (or ADVISOR_TASK_RULES). Each rule is a
+condition over presence flags plus the task it creates:
+
+    {"when": <cond>, "item_name": ..., "required_for": ..., "target": ...,
+     "priority": ..., "channel": ..., "due_days": N, "reason": ...}
+
+A condition is one of
+    "flag.name"                                   flag is present
+    {"not": <cond>}
+    {"all": [<cond>, ...]} / {"any": [<cond>, ...]}
+    {"missing_at_most": {"group": "pensions", "count": 3}}
+
+"for_each": "<group>" expands a rule once per field of that presence group,
+substituting {field} and {label} (field with spaces) into strings.
+
+The whole book is evaluated at once over a clients x flags boolean matrix:
+every rule becomes one boolean column, and the (client, rule) hits become
+TaskTable columns through index arithmetic, with no per-task Python work.
+"""
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel, TypeAdapter
+
+from core.constants import AdviceStage, ChaseChannel, ChasePriority, ChaseStatus, ChaseTarget
+from core.task_table import TASK_FIELDS, StringPool, TaskTable
+from ingestion.extractor import PRESENCE_FLAGS, presence_to_bits
+
+DEFAULT_RULES_PATH = Path(os.getenv("ADVISOR_TASK_RULES", Path(__file__).with_name("task_rules.json")))
+
+
+class TaskRule(BaseModel):
+    when: Any
+    item_name: str
+    required_for: AdviceStage
+    target: ChaseTarget
+    priority: ChasePriority = ChasePriority.MEDIUM
+    channel: ChaseChannel = ChaseChannel.EMAIL
+    status: ChaseStatus = ChaseStatus.NOT_STARTED
+    due_days: int = 0
+    reason: Optional[str] = None
+    for_each: Optional[str] = None
+
+
+_RULES = TypeAdapter(List[TaskRule])
+
+Condition = Callable[[np.ndarray], np.ndarray]
+
+
+def _substitute(value, field: str):
+    label = field.replace("_", " ")
+    if isinstance(value, str):
+        return value.format(field=field, label=label)
+    if isinstance(value, list):
+        return [_substitute(v, field) for v in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, field) for k, v in value.items()}
+    return value
+
+
+def _compile_condition(cond, flags: Sequence[str]) -> Condition:
+    if isinstance(cond, str):
+        if cond not in flags:
+            raise ValueError(f"unknown presence flag in rule: {cond!r}")
+        col = flags.index(cond)
+        return lambda m: m[:, col]
+
+    if isinstance(cond, dict) and len(cond) == 1:
+        (op, arg), = cond.items()
+        if op == "not":
+            inner = _compile_condition(arg, flags)
+            return lambda m: ~inner(m)
+        if op in ("all", "any"):
+            parts = [_compile_condition(c, flags) for c in arg]
+            reduce = np.logical_and.reduce if op == "all" else np.logical_or.reduce
+            return lambda m: reduce([p(m) for p in parts])
+        if op == "missing_at_most":
+            prefix = arg["group"] + "."
+            cols = [i for i, f in enumerate(flags) if f.startswith(prefix)]
+            if not cols:
+                raise ValueError(f"unknown presence group in rule: {arg['group']!r}")
+            limit = int(arg["count"])
+            return lambda m: (~m[:, cols]).sum(axis=1) <= limit
+
+    raise ValueError(f"invalid rule condition: {cond!r}")
+
+
+class TaskRules:
+    def __init__(self, rules: List[TaskRule], flags: Sequence[str] = PRESENCE_FLAGS):
+        self.flags = list(flags)
+        self.rules: List[TaskRule] = []
+        for rule in rules:
+            if rule.for_each is None:
+                self.rules.append(rule)
+                continue
+            prefix = rule.for_each + "."
+            fields = [f[len(prefix):] for f in self.flags if f.startswith(prefix)]
+            if not fields:
+                raise ValueError(f"unknown presence group in for_each: {rule.for_each!r}")
+            raw = rule.model_dump(mode="json", exclude={"for_each"})
+            for field in fields:
+                self.rules.append(TaskRule(**_substitute(raw, field)))
+
+        self._conditions = [_compile_condition(r.when, self.flags) for r in self.rules]
+        self._due_days = np.array([r.due_days for r in self.rules], dtype=np.int64)
+        self._provider_rules = np.array([r.target == ChaseTarget.PROVIDER for r in self.rules], dtype=bool)
+
+        # one code per rule for every field the rule fixes
+        self._rule_pools = {}
+        self._rule_codes = {}
+        for field in ("item_name", "required_for", "target", "status", "priority", "channel", "reason"):
+            pool = StringPool()
+            codes = []
+            for r in self.rules:
+                v = getattr(r, field)
+                codes.append(pool.code(v.value if hasattr(v, "value") else v))
+            self._rule_pools[field] = pool
+            self._rule_codes[field] = np.array(codes, dtype=np.uint32)
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES_PATH) -> "TaskRules":
+        return cls(_RULES.validate_json(Path(path).read_bytes()))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, matrix: np.ndarray) -> np.ndarray:
+        """clients x flags bool matrix -> clients x rules bool matrix of hits."""
+        if not self.rules:
+            return np.zeros((len(matrix), 0), dtype=bool)
+        return np.column_stack([c(matrix) for c in self._conditions])
+
+    def build_table(
+        self,
+        matrix: np.ndarray,
+        client_ids: Sequence[str],
+        client_names: Sequence[str],
+        source_docs: Sequence[str],
+        anchor_ordinals: np.ndarray,
+        providers: Optional[Sequence[Optional[str]]] = None,
+    ) -> TaskTable:
+        """
+        Tasks for a whole book. anchor_ordinals[i] is date.toordinal() of
+        client i's anchor date and providers[i] the provider client i's
+        document names (set on target=provider tasks only). Rows come out
+        client by client, rules in file order (the same order build_tasks has
+        always produced).
+        """
+        ci, ri = np.nonzero(self.evaluate(matrix))
+
+        pools, columns = {}, {}
+        for field, values in (
+            ("client_id", client_ids),
+            ("client_name", client_names),
+            ("source_doc", source_docs),
+        ):
+            pool = StringPool()
+            per_client = np.fromiter((pool.code(v) for v in values), dtype=np.uint32, count=len(values))
+            pools[field] = pool
+            columns[field] = per_client[ci]
+
+        for field, pool in self._rule_pools.items():
+            pools[field] = pool
+            columns[field] = self._rule_codes[field][ri]
+
+        pool = StringPool()
+        if providers is None:
+            columns["provider"] = np.zeros(len(ci), dtype=np.uint32)
+        else:
+            per_client = np.fromiter((pool.code(v) for v in providers), dtype=np.uint32, count=len(providers))
+            columns["provider"] = np.where(self._provider_rules[ri], per_client[ci], 0).astype(np.uint32)
+        pools["provider"] = pool
+
+        due = np.asarray(anchor_ordinals, dtype=np.int64)[ci] + self._due_days[ri]
+        uniq, inverse = np.unique(due, return_inverse=True)
+        due_pool = StringPool(date.fromordinal(int(o)).isoformat() for o in uniq)
+        pools["due_date"] = due_pool
+        columns["due_date"] = (inverse.reshape(-1) + 1).astype(np.uint32)
+
+        return TaskTable(TASK_FIELDS, pools, columns)
+
+
+_default_rules = {}
+
+
+def default_rules() -> TaskRules:
+    """The rules in DEFAULT_RULES_PATH, recompiled whenever the file changes."""
+    stamp = DEFAULT_RULES_PATH.stat().st_mtime_ns
+    if _default_rules.get("stamp") != stamp:
+        _default_rules["rules"] = TaskRules.load(DEFAULT_RULES_PATH)
+        _default_rules["stamp"] = stamp
+    return _default_rules["rules"]
+
+
+def presence_matrix(presences: Sequence[dict], flags: Sequence[str] = PRESENCE_FLAGS) -> np.ndarray:
+    bits = np.fromiter((presence_to_bits(p, flags) for p in presences), dtype=np.uint32, count=len(presences))
+    return bits_to_matrix(bits, len(flags))
+
+
+def extraction_matrix(extractions: Sequence[dict], flags: Sequence[str] = PRESENCE_FLAGS) -> np.ndarray:
+    """
+    presence_matrix for extraction records, using the presence_bits that
+    extract_document packs (against PRESENCE_FLAGS) instead of re-packing
+    every presence dict.
+    """
+    if list(flags) != list(PRESENCE_FLAGS) or not all("presence_bits" in e for e in extractions):
+        return presence_matrix([e["presence"] for e in extractions], flags)
+    bits = np.fromiter((e["presence_bits"] for e in extractions), dtype=np.uint32, count=len(extractions))
+    return bits_to_matrix(bits, len(flags))
+
+
+def bits_to_matrix(bits, n_flags: int) -> np.ndarray:
+    """Unpack packed presence bits (e.g. ExtractionStore.presence_bits()) to a bool matrix."""
+    bits = np.asarray(bits, dtype=np.uint32)
+    return ((bits[:, None] >> np.arange(n_flags, dtype=np.uint32)) & 1).astype(bool)
+
+
+def anchor_ordinal(anchor) -> int:
+    """date.toordinal() of an anchor (datetime, date, ISO string) or of today if missing."""
+    if anchor is None:
+        return datetime.utcnow().date().toordinal()
+    if isinstance(anchor, str):
+        anchor = date.fromisoformat(anchor[:10])
+    if isinstance(anchor, datetime):
+        anchor = anchor.date()
+    return anchor.toordinal()
+
+
+def build_task_table(extractions: Sequence[dict], rules: Optional[TaskRules] = None,
+                     validate: bool = True) -> TaskTable:
+    """
+    Tasks for a list of extraction records (the shape extract_document returns).
+    With validate (the default) the finished book is checked against
+    core.schemas column by column (TaskTable.validate) before it is
+    returned, as /run and build_tasks_from_docs did before rules moved to
+    data. Raises pydantic.ValidationError.
+    """
+    rules = rules or default_rules()
+    table = rules.build_table(
+        extraction_matrix(extractions, rules.flags),
+        [e["client_id"] for e in extractions],
+        [e["client_name"] for e in extractions],
+        [e["source_file"] for e in extractions],
+        np.array([anchor_ordinal(e.get("anchor_date")) for e in extractions], dtype=np.int64),
+        [e.get("provider") for e in extractions],
+    )
+    if validate:
+        table.validate()
+    return table
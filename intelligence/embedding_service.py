@@ -0,0 +1,270 @@
+"""
+Shared embedding + search sidecar.
+
+One process owns the sentence-transformer model and the Chroma index; API
+workers talk to it over a Unix socket, so adding uvicorn/gunicorn workers no
+longer adds a copy of torch and the model each, and all index writes are
+serialised here.
+
+    python -m intelligence.embedding_service --socket /tmp/advisor-embed.sock
+    ADVISOR_EMBED_SOCKET=/tmp/advisor-embed.sock uvicorn app.main:app --workers 4
+
+Wire format, both directions, one frame per message:
+
+    !BII  op, meta_len, blob_len
+    meta  compact UTF-8 JSON (texts, ids, metadatas, query results, errors)
+    blob  raw little-endian float32 embeddings, shape given in meta["shape"]
+
+Embeddings travel as raw float32 rather than JSON number lists, which is
+where almost all of the bytes are.
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+OP_OK = 0
+OP_ENCODE = 1
+OP_QUERY = 2
+OP_ADD = 3
+OP_COUNT = 4
+OP_UPSERT = 5
+OP_ERROR = 255
+
+# safe to resend if the connection drops mid-call: replaying them can't
+# change the index (an ADD that was applied would fail on duplicate ids)
+IDEMPOTENT_OPS = frozenset({OP_ENCODE, OP_QUERY, OP_COUNT, OP_UPSERT})
+
+_FRAME = struct.Struct("!BII")
+_FLOAT32 = np.dtype("<f4")
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if not k:
+            raise ConnectionError("embedding service connection closed")
+        got += k
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, op: int, meta: dict, blob: bytes = b""):
+    raw = json.dumps(meta, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    sock.sendall(_FRAME.pack(op, len(raw), len(blob)) + raw + blob)
+
+
+def recv_frame(sock: socket.socket):
+    op, meta_len, blob_len = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    meta = json.loads(_recv_exact(sock, meta_len)) if meta_len else {}
+    blob = _recv_exact(sock, blob_len) if blob_len else b""
+    return op, meta, blob
+
+
+def _pack_matrix(arr) -> tuple:
+    arr = np.ascontiguousarray(arr, dtype=_FLOAT32)
+    return list(arr.shape), arr.tobytes()
+
+
+def _unpack_matrix(meta: dict, blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=_FLOAT32).reshape(meta["shape"])
+
+
+# ---------- server ----------
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        index = self.server.index
+        while True:
+            try:
+                op, meta, blob = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                if op == OP_ENCODE:
+                    shape, out = _pack_matrix(index.encode(meta["texts"]))
+                    send_frame(self.request, OP_OK, {"shape": shape}, out)
+
+                elif op == OP_QUERY:
+                    emb = _unpack_matrix(meta, blob) if blob else index.encode(meta["texts"])
+                    res = index.query(
+                        query_embeddings=emb,
+                        n_results=meta.get("n_results", 3),
+                        where=meta.get("where"),
+                        firms=meta.get("firms"),
+                    )
+                    send_frame(self.request, OP_OK, _query_meta(res))
+
+                elif op in (OP_ADD, OP_UPSERT):
+                    emb = _unpack_matrix(meta, blob) if blob else index.encode(meta["documents"])
+                    write = index.add if op == OP_ADD else index.upsert
+                    with self.server.write_lock:
+                        write(meta["ids"], meta["documents"], meta["metadatas"], emb)
+                    send_frame(self.request, OP_OK, {"added": len(meta["ids"])})
+
+                elif op == OP_COUNT:
+                    send_frame(self.request, OP_OK, {"count": index.count()})
+
+                else:
+                    send_frame(self.request, OP_ERROR, {"error": f"unknown op {op}"})
+            except Exception as e:
+                send_frame(self.request, OP_ERROR, {"error": f"{type(e).__name__}: {e}"})
+
+
+def _query_meta(res) -> dict:
+    """A query result as frame meta; fails loudly rather than dropping a field."""
+    meta = dict(res)
+    for k, v in meta.items():
+        try:
+            json.dumps(v)
+        except TypeError as e:
+            raise TypeError(f"query result field {k!r} is not JSON serialisable: {e}") from None
+    return meta
+
+
+def _socket_in_use(socket_path: str) -> bool:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, index=None):
+        from intelligence.vector_store import LocalIndex
+
+        if os.path.exists(socket_path):
+            if _socket_in_use(socket_path):
+                raise OSError(f"an embedding service is already listening on {socket_path}")
+            os.unlink(socket_path)      # left behind by a service that died
+        self.index = index or LocalIndex()
+        self.write_lock = threading.Lock()
+        super().__init__(socket_path, _Handler)
+
+
+# ---------- client ----------
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+class EmbeddingClient:
+    """
+    Talks to EmbeddingServer. Keeps up to pool_size idle connections around
+    and hands one to each in-flight call, so concurrent requests in a worker
+    don't serialise on a single socket. Mirrors LocalIndex's interface.
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = 8, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> socket.socket:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        s.connect(self.socket_path)
+        return s
+
+    @contextmanager
+    def _connection(self, fresh: bool = False):
+        sock = None
+        if not fresh:
+            try:
+                sock = self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        if sock is None:
+            sock = self._connect()
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            raise
+        try:
+            self._idle.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def _call(self, op: int, meta: dict, blob: bytes = b""):
+        idempotent = op in IDEMPOTENT_OPS
+        for attempt in (0, 1):
+            try:
+                # other ops get a new connection, so a stale pooled socket can't
+                # fail them and a dropped connection is never retried
+                with self._connection(fresh=not idempotent) as sock:
+                    send_frame(sock, op, meta, blob)
+                    rop, rmeta, rblob = recv_frame(sock)
+                break
+            except ConnectionError:
+                # a pooled socket may have been closed by a service restart
+                if attempt or not idempotent:
+                    raise
+        if rop == OP_ERROR:
+            raise EmbeddingError(rmeta.get("error", "embedding service error"))
+        return rmeta, rblob
+
+    def encode(self, texts) -> np.ndarray:
+        meta, blob = self._call(OP_ENCODE, {"texts": list(texts)})
+        return _unpack_matrix(meta, blob)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 3,
+              where=None, firms=None):
+        meta = {"n_results": n_results, "where": where, "firms": list(firms) if firms else None}
+        blob = b""
+        if query_embeddings is not None:
+            meta["shape"], blob = _pack_matrix(query_embeddings)
+        else:
+            meta["texts"] = list(query_texts)
+        res, _ = self._call(OP_QUERY, meta, blob)
+        return res
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        self._write(OP_ADD, ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids, documents, metadatas, embeddings=None):
+        self._write(OP_UPSERT, ids, documents, metadatas, embeddings)
+
+    def _write(self, op: int, ids, documents, metadatas, embeddings):
+        meta = {"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)}
+        blob = b""
+        if embeddings is not None:
+            meta["shape"], blob = _pack_matrix(embeddings)
+        self._call(op, meta, blob)
+
+    def count(self) -> int:
+        meta, _ = self._call(OP_COUNT, {})
+        return meta["count"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared embedding/search service")
+    parser.add_argument("--socket", default=os.getenv("ADVISOR_EMBED_SOCKET", "/tmp/advisor-embed.sock"))
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket)
+    # load the model up front so the first request doesn't pay for it
+    server.index.encode(["warmup"])
+    print(f"[embedding_service] listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
@@ -0,0 +1,324 @@
+"""
+Offline vector index rebuilds with an atomic switch-over.
+
+    python -m intelligence.index_builder rebuild [--source data/source_docs] [--export data/mock_clients.json]
+    python -m intelligence.index_builder rollback
+    python -m intelligence.index_builder status
+
+A rebuild never touches the live index. It encodes every ingestion source,
+the source documents and the CRM export's conversations (the same records
+ingestion.load_mock_data upserts), streaming them in batches into a new
+generation directory next to it
+
+    vectordb.generations/gen-000004/
+
+validates it (it is not empty and has not lost a large share of the live
+index's documents, every document's own text finds it, sample questions
+find the same documents the live index does) and only then rewrites the
+pointer file
+vectordb.current with a temp file + rename. Processes pick the new generation
+up on their next call (see vector_store.LocalIndex); queries already running
+finish on the generation they started on. The previous generation is kept
+for `rollback`, older ones are removed.
+"""
+import itertools
+import json
+import os
+import random
+import shutil
+from pathlib import Path
+from typing import Collection, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ingestion.build_tasks_from_docs import extract_document
+from ingestion.dedupe import dedupe_docs
+from ingestion.docx_reader import load_source_docs
+from ingestion.load_mock_data import DEFAULT_EXPORT, conversation_docs, iter_json_array
+from intelligence.vector_store import (
+    VECTORDB_PATH,
+    LocalIndex,
+    date_key,
+    document_firm,
+    generations_dir,
+    pointer_path,
+    read_pointer,
+    resolve_index_path,
+)
+
+DEFAULT_SOURCE_DIR = "data/source_docs"
+DEFAULT_BATCH_SIZE = 64
+SELF_CHECKS = 5
+DEFAULT_SAMPLE_QUESTIONS = (
+    "Which clients mentioned pensions?",
+    "Who discussed ISA planning?",
+)
+KEEP_GENERATIONS = 2     # current + previous
+# refuse a generation with fewer documents than this share of the live one;
+# a source dir that failed to mount looks like a very small corpus
+MIN_COUNT_RATIO = 0.5
+
+Record = Tuple[str, str, dict]
+
+
+class IndexValidationError(RuntimeError):
+    pass
+
+
+def document_records(docs: Iterable[dict]) -> List[Record]:
+    """
+    (id, text, metadata) for each loaded source doc, one per client id.
+    Near-duplicate copies of a document are left out (see ingestion.dedupe).
+    """
+    records = {}
+    docs, _ = dedupe_docs(docs)
+    for d in docs:
+        text = d.get("text", "")
+        if not text.strip():
+            continue
+        e = extract_document({"text": text, "file_name": d.get("file_name", "unknown.docx")})
+        records[e["client_id"]] = (
+            e["client_id"],
+            text,
+            {
+                "client_id": e["client_id"],
+                "client_name": e["client_name"],
+                "source": e["source_file"],
+                "advisor": e["advisor"],
+                "firm": document_firm(e.get("firm")),
+                "doc_date": date_key(e["anchor_date"]),
+            },
+        )
+    return list(records.values())
+
+
+def export_records(export=DEFAULT_EXPORT) -> Iterator[Record]:
+    """(id, text, metadata) for every conversation in a CRM export, streamed; none if it doesn't exist."""
+    export = Path(export)
+    if not export.exists():
+        return
+    for client, _ in iter_json_array(export):
+        yield from conversation_docs(client)
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _generation_names(base: str) -> List[str]:
+    root = generations_dir(base)
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and p.name.startswith("gen-"))
+
+
+def _next_generation(base: str) -> str:
+    names = _generation_names(base)
+    last = int(names[-1][4:]) if names else 0
+    return f"gen-{last + 1:06d}"
+
+
+def build_generation(records: Iterable[Record], base: str = VECTORDB_PATH,
+                     batch_size: int = DEFAULT_BATCH_SIZE, index: Optional[LocalIndex] = None,
+                     sample_size: int = SELF_CHECKS):
+    """
+    Encode and write records into a fresh generation directory, batch_size at
+    a time, so `records` may be a stream. A repeated id keeps its last record.
+    Returns (name, index, ids written, a random sample of records for
+    validate_generation's self-retrieval check).
+    """
+    name = _next_generation(base)
+    path = generations_dir(base) / name
+    path.mkdir(parents=True)
+
+    gen_index = LocalIndex(path=str(path))
+    if index is not None:
+        gen_index._model = index._model          # reuse an already loaded model
+
+    written, sample = set(), []
+    rng = random.Random(0)
+    records = iter(records)
+    while True:
+        batch = {r[0]: r for r in itertools.islice(records, batch_size)}
+        if not batch:
+            break
+        ids = list(batch)
+        texts = [batch[i][1] for i in ids]
+        gen_index.upsert(ids, texts, [batch[i][2] for i in ids], gen_index.encode(texts))
+        for r in batch.values():
+            if r[0] in written:
+                # rewritten by a later batch: check the text that is there now
+                sample = [r if s[0] == r[0] else s for s in sample]
+                continue
+            # reservoir sample: every record is equally likely to be checked
+            written.add(r[0])
+            if len(sample) < sample_size:
+                sample.append(r)
+            else:
+                j = rng.randrange(len(written))
+                if j < sample_size:
+                    sample[j] = r
+    return name, gen_index, written, sample
+
+
+def live_index(base: str = VECTORDB_PATH) -> Optional[LocalIndex]:
+    """The index currently being served from `base`, or None if there is none yet."""
+    path = resolve_index_path(base)
+    return LocalIndex(path=path) if Path(path).is_dir() else None
+
+
+def validate_generation(gen_index: LocalIndex, ids: Collection[str], sample: Sequence[Record],
+                        sample_questions: Sequence[str] = DEFAULT_SAMPLE_QUESTIONS,
+                        live: Optional[LocalIndex] = None,
+                        min_count_ratio: float = MIN_COUNT_RATIO):
+    """
+    Raise IndexValidationError unless the new generation looks servable.
+    `ids` are the ids written to it and `sample` records to check
+    self-retrieval on (see build_generation). With `live` (the index being
+    replaced), also refuse one that shrank below min_count_ratio of it, or
+    whose answers to the sample questions share nothing with the live
+    index's.
+    """
+    if not ids:
+        raise IndexValidationError("no documents to index; refusing to activate an empty index")
+    if gen_index.count() != len(ids):
+        raise IndexValidationError(
+            f"new index has {gen_index.count()} documents, expected {len(ids)}"
+        )
+    live_count = live.count() if live is not None else 0
+    if live_count and len(ids) < live_count * min_count_ratio:
+        raise IndexValidationError(
+            f"new index has {len(ids)} documents, the live one {live_count}; "
+            f"refusing to drop below {min_count_ratio:.0%} (use --force if intended)"
+        )
+
+    res = gen_index.query(query_texts=[r[1] for r in sample], n_results=3)
+    for (doc_id, _, _), hits in zip(sample, res.get("ids") or []):
+        if doc_id not in hits:
+            raise IndexValidationError(f"document {doc_id!r} does not retrieve itself")
+
+    if not sample_questions:
+        return
+    n = min(3, len(ids))
+    res = gen_index.query(query_texts=list(sample_questions), n_results=n)
+    got = res.get("ids") or []
+    for q, hits in zip(sample_questions, got):
+        if len(hits) < n:
+            raise IndexValidationError(f"sample question returned {len(hits)} of {n} hits: {q!r}")
+    if not live_count:
+        return
+
+    # a rebuild mostly re-indexes the same documents, so where the live index's
+    # answers are still in the corpus the new one should find at least one of them
+    before = live.query(query_texts=list(sample_questions), n_results=n).get("ids") or []
+    for q, old, new in zip(sample_questions, before, got):
+        still_there = [i for i in old if i in ids]
+        if still_there and not set(still_there) & set(new):
+            raise IndexValidationError(
+                f"sample question finds none of the live index's documents: {q!r}"
+            )
+
+
+def _write_pointer(base: str, current: Optional[str], previous: Optional[str]):
+    ptr = pointer_path(base)
+    ptr.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ptr.with_name(ptr.name + f".tmp{os.getpid()}")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"current": current, "previous": previous}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ptr)
+    _fsync_dir(ptr.parent)
+
+
+def activate(name: str, base: str = VECTORDB_PATH, keep: int = KEEP_GENERATIONS):
+    """Point the live index at generation `name`; the old one becomes `previous`."""
+    current = read_pointer(base).get("current")
+    _write_pointer(base, name, current)
+    prune(base, keep)
+
+
+def rollback(base: str = VECTORDB_PATH) -> Optional[str]:
+    """
+    Swap back to the previous generation (or to the plain `base` directory if
+    the previous live index predates generations). Returns what is now live.
+    """
+    ptr = read_pointer(base)
+    if "previous" not in ptr:
+        raise ValueError("no previous index generation to roll back to")
+    _write_pointer(base, ptr["previous"], ptr["current"])
+    return ptr["previous"]
+
+
+def prune(base: str = VECTORDB_PATH, keep: int = KEEP_GENERATIONS):
+    """Remove generations other than current/previous, oldest first, down to `keep`."""
+    ptr = read_pointer(base)
+    live = {ptr.get("current"), ptr.get("previous")}
+    names = _generation_names(base)
+    for name in names[:max(0, len(names) - keep)]:
+        if name not in live:
+            shutil.rmtree(generations_dir(base) / name, ignore_errors=True)
+
+
+def rebuild(source_dir: str = DEFAULT_SOURCE_DIR, base: str = VECTORDB_PATH,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            sample_questions: Sequence[str] = DEFAULT_SAMPLE_QUESTIONS,
+            force: bool = False, export=DEFAULT_EXPORT) -> dict:
+    """
+    Build, validate and activate a new generation from the source docs and
+    the CRM export's conversations, so a rebuild keeps everything ingestion
+    put in the live index. `force` skips the comparison with the live index
+    (an intentional large shrink), not the checks on the new generation itself.
+    """
+    records = itertools.chain(document_records(load_source_docs(source_dir)), export_records(export))
+    live = None if force else live_index(base)
+    name, gen_index, ids, sample = build_generation(records, base, batch_size)
+    try:
+        if not ids:
+            raise IndexValidationError(f"no documents found in {source_dir} or {export}")
+        validate_generation(gen_index, ids, sample, sample_questions, live=live)
+    except Exception:
+        shutil.rmtree(generations_dir(base) / name, ignore_errors=True)
+        raise
+    activate(name, base)
+    return {"generation": name, "documents": len(ids)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vector index generations")
+    parser.add_argument("--base", default=VECTORDB_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("rebuild", help="build, validate and switch to a new index")
+    r.add_argument("--source", default=DEFAULT_SOURCE_DIR)
+    r.add_argument("--export", default=str(DEFAULT_EXPORT), help="CRM export to include (skipped if missing)")
+    r.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    r.add_argument("--sample", action="append", help="sample question (repeatable)")
+    r.add_argument("--force", action="store_true",
+                   help="activate even if much smaller than, or unlike, the live index")
+
+    sub.add_parser("rollback", help="switch back to the previous generation")
+    sub.add_parser("status", help="show the live and previous generations")
+
+    args = parser.parse_args()
+    if args.cmd == "rebuild":
+        out = rebuild(args.source, args.base, args.batch_size,
+                      args.sample or DEFAULT_SAMPLE_QUESTIONS, args.force, args.export)
+        print(f"Activated {out['generation']} ({out['documents']} documents)")
+    elif args.cmd == "rollback":
+        now = rollback(args.base)
+        print(f"Rolled back to {now or args.base}")
+    else:
+        ptr = read_pointer(args.base)
+        print(f"current:  {ptr.get('current') or args.base}")
+        print(f"previous: {ptr.get('previous') or '-'}")
+        print(f"on disk:  {', '.join(_generation_names(args.base)) or '-'}")
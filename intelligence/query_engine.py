@@ -1,33 +1,180 @@
-from intelligence.vector_store import query as vs_query
+import time
+
+from intelligence.reranker import RERANK_BUDGET_MS, RERANK_ENABLED, get_reranker, relevance
+from intelligence.vector_store import build_where
+from intelligence.vector_store import encode as vs_encode
+from intelligence.vector_store import query_embeddings as vs_query_embeddings
 
 
 class QueryEngine:
-    def __init__(self, collection):
+    """
+    Answers questions with the best matching clients.
+
+    Hits are grouped by client, so a client with several matching documents
+    counts once. To still return top_k distinct clients in one call, the index
+    is over-fetched: first INITIAL_OVERFETCH x top_k hits, growing by
+    OVERFETCH_GROWTH until top_k clients are found, the index runs out of
+    hits, or MAX_FETCH is reached. Questions are only ever encoded once.
+
+    aggregate="max" ranks a client by its best hit. Hits come back nearest
+    first, so once top_k distinct clients have been seen no later hit can
+    change that ranking and fetching stops there.
+    aggregate="sum" ranks by the sum of hit scores over everything fetched,
+    which favours clients with many matching passages.
+
+    filters (client_id, source, advisor, firm, date_from, date_to) are pushed
+    down into the index query, so over-fetching only ever sees matching
+    documents; firm also picks the shard when the index is sharded by firm.
+
+    rerank=True (default: ADVISOR_RERANK) rescores each question's first
+    reranker.candidates hits with a cross-encoder (see intelligence.reranker)
+    and ranks clients by that instead; reranked hits score sigmoid(logit)
+    and hits past the shortlist score 0, so every reranked client ranks
+    ahead of clients only found further down.
+    All questions of one call share rerank_budget_ms; a question the budget
+    does not cover keeps the bi-encoder ranking. Answers then carry
+    "reranked": true/false.
+    """
+
+    INITIAL_OVERFETCH = 2
+    OVERFETCH_GROWTH = 4
+    MAX_FETCH = 1000
+
+    def __init__(self, collection, reranker=None, rerank_budget_ms: float = RERANK_BUDGET_MS):
         self.collection = collection
+        self.reranker = reranker
+        self.rerank_budget_ms = rerank_budget_ms
 
-    def ask(self, q: str, top_k: int = 5):
-        question = (q or "").strip()
-        if not question:
-            return {"results": []}
+    def ask(self, q: str, top_k: int = 5, aggregate: str = "max", filters=None, rerank=None):
+        return self.ask_batch([(q, top_k)], aggregate=aggregate, filters=filters, rerank=rerank)[0]
 
-        raw = vs_query(question, n_results=top_k)
+    def ask_batch(self, questions, aggregate: str = "max", filters=None, rerank=None):
+        """
+        Answer several (question, top_k) pairs. One encode for the batch and
+        one index query per over-fetch round (usually one round in total).
+        Returns one {"results": [...]} per question, in order.
+        """
+        if aggregate not in ("max", "sum"):
+            raise ValueError("aggregate must be 'max' or 'sum'")
 
-        metas = (raw.get("metadatas") or [[]])[0]
-        results = []
+        cleaned = [((q or "").strip(), top_k) for q, top_k in questions]
+        live = [i for i, (q, _) in enumerate(cleaned) if q]
+        answers = [{"results": []} for _ in cleaned]
+        if not live:
+            return answers
 
-        seen = set()
-        for m in metas:
-            client = m.get("client_name") or m.get("client") or "Unknown Client"
-            source = m.get("source_file") or m.get("file_name") or m.get("source") or "unknown_source"
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        where = build_where(**filters)
+        firms = [filters["firm"]] if filters.get("firm") else None
+
+        if rerank is None:
+            rerank = RERANK_ENABLED
+        reranker = (self.reranker or get_reranker()) if rerank else None
+        deadline = time.monotonic() + self.rerank_budget_ms / 1000.0 if rerank else None
+        # the cross-encoder only helps if it sees more than the bare top_k
+        min_fetch = reranker.candidates if reranker is not None else 0
+
+        embeddings = vs_encode([cleaned[i][0] for i in live])
+        row_of = {i: r for r, i in enumerate(live)}
+        fetch = {i: min(max(cleaned[i][1] * self.INITIAL_OVERFETCH, min_fetch), self.MAX_FETCH) for i in live}
+
+        pending = live
+        while pending:
+            n_results = max(fetch[i] for i in pending)
+            raw = vs_query_embeddings(
+                [embeddings[row_of[i]] for i in pending],
+                n_results=n_results,
+                where=where,
+                firms=firms,
+            )
+            all_metas = raw.get("metadatas") or [[] for _ in pending]
+            all_dists = raw.get("distances") or [[] for _ in pending]
+            all_ids = raw.get("ids") or [[] for _ in pending]
+            all_docs = raw.get("documents") or [[] for _ in pending]
 
-            key = (client, source)
-            if key in seen:
-                continue
-            seen.add(key)
+            still_pending = []
+            for i, metas, dists, ids, docs in zip(pending, all_metas, all_dists, all_ids, all_docs):
+                top_k = cleaned[i][1]
+                groups = self._group(metas, dists)
+                exhausted = len(metas) < n_results or n_results >= self.MAX_FETCH
+                if len(groups) >= top_k or exhausted:
+                    if reranker is None:
+                        answers[i] = {"results": self._rank(groups, top_k, aggregate)}
+                        continue
+                    scores = self._rerank(reranker, cleaned[i][0], metas, dists, ids, docs, deadline)
+                    if scores is not None:
+                        groups = self._group(*scores)
+                    answers[i] = {"results": self._rank(groups, top_k, aggregate), "reranked": scores is not None}
+                else:
+                    fetch[i] = min(n_results * self.OVERFETCH_GROWTH, self.MAX_FETCH)
+                    still_pending.append(i)
+            pending = still_pending
 
-            results.append({"client": client, "source": source})
+        return answers
 
-        return {"results": results}
+    @staticmethod
+    def _rerank(reranker, question, metas, dists, ids, docs, deadline):
+        """
+        (metas, dists, scores) with the first reranker.candidates hits reordered
+        by cross-encoder score, or None if the budget ran out first. Hits past
+        the shortlist follow in bi-encoder order with score 0: they were never
+        reranked, and a bi-encoder score is not on the cross-encoder's scale,
+        so they must not add to (or, under "sum", outweigh) reranked scores.
+        """
+        n = min(reranker.candidates, len(metas), len(ids))
+        logits = reranker.score(question, ids[:n], (docs or [None] * n)[:n], deadline)
+        if logits is None:
+            return None
+        dists = dists or [None] * len(metas)
+        order = sorted(range(n), key=lambda j: logits[j], reverse=True)
+        head_scores = [relevance(logits[j]) for j in order]
+        tail_scores = [0.0] * (len(metas) - n)
+        return (
+            [metas[j] for j in order] + list(metas[n:]),
+            [dists[j] for j in order] + list(dists[n:]),
+            head_scores + tail_scores,
+        )
 
+    @staticmethod
+    def _group(metas, dists, scores=None):
+        """client -> aggregate info, in order of each client's nearest (or best reranked) hit."""
+        groups = {}
+        dists = dists or [None] * len(metas)
+        if scores is None:
+            scores = [1.0 / (1.0 + d) if d is not None else 0.0 for d in dists]
+        for m, d, score in zip(metas, dists, scores):
+            m = m or {}
+            client = m.get("client_name") or m.get("client") or "Unknown Client"
+            source = m.get("source_file") or m.get("file_name") or m.get("source") or "unknown_source"
 
+            g = groups.get(client)
+            if g is None:
+                groups[client] = {
+                    "client": client,
+                    "source": source,
+                    "distance": d,
+                    "max_score": score,
+                    "sum_score": score,
+                    "hits": 1,
+                }
+            else:
+                g["sum_score"] += score
+                g["hits"] += 1
+        return groups
 
+    @staticmethod
+    def _rank(groups, top_k, aggregate):
+        ranked = list(groups.values())
+        if aggregate == "sum":
+            ranked.sort(key=lambda g: g["sum_score"], reverse=True)
+
+        results = []
+        for g in ranked[:top_k]:
+            results.append({
+                "client": g["client"],
+                "source": g["source"],
+                "distance": g["distance"],
+                "score": round(g[f"{aggregate}_score"], 6),
+                "hits": g["hits"],
+            })
+        return results
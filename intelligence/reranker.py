@@ -0,0 +1,145 @@
+"""
+Optional cross-encoder rerank of the bi-encoder shortlist.
+
+The bi-encoder (vector index) is fast but coarse; a cross-encoder reads the
+question and a passage together and scores them much more accurately, at
+the cost of one model call per (question, passage) pair. QueryEngine uses it
+on at most CANDIDATES hits per question:
+
+- pairs are scored in batches of BATCH_SIZE;
+- scores are cached by (question hash, doc id), so a repeated or re-asked
+  question only scores passages it has not seen;
+- every request gets a time budget (ADVISOR_RERANK_BUDGET_MS). The budget is
+  checked before each batch; once it is spent the remaining questions keep
+  the bi-encoder order, so a slow model adds bounded latency, never errors.
+
+Off unless ADVISOR_RERANK is set or a request asks for it. With it set the
+app starts loading the model at startup; either way the load (possibly a
+download) runs on a background thread, and a request with a budget that
+arrives before it finishes counts as out of budget instead of waiting.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+RERANK_ENABLED = os.getenv("ADVISOR_RERANK", "").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("ADVISOR_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BUDGET_MS = float(os.getenv("ADVISOR_RERANK_BUDGET_MS", "150"))
+
+CANDIDATES = 20
+BATCH_SIZE = 16
+CACHE_SIZE = 50_000
+
+
+def question_key(question: str) -> str:
+    return hashlib.blake2b(question.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def relevance(logit: float) -> float:
+    """
+    Cross-encoder logit -> (0, 1). Only comparable with other reranked
+    scores, not with the bi-encoder's 1 / (1 + distance).
+    """
+    return 1.0 / (1.0 + math.exp(-max(min(logit, 50.0), -50.0)))
+
+
+class Reranker:
+    def __init__(self, model_name: str = RERANK_MODEL, candidates: int = CANDIDATES,
+                 batch_size: int = BATCH_SIZE, cache_size: int = CACHE_SIZE):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+
+    @property
+    def model(self):
+        """The cross-encoder, loading it on this thread if it isn't yet."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load_in_background(self):
+        """Start loading the model on a daemon thread, once."""
+        with self._lock:
+            if self._loader is not None or self._model is not None:
+                return
+            self._loader = threading.Thread(target=self._load, name="rerank-model", daemon=True)
+        self._loader.start()
+
+    def _load(self):
+        try:
+            self.model
+        except Exception as e:
+            print(f"[rerank] loading {self.model_name} failed: {e}")
+            with self._lock:
+                self._loader = None       # let a later request try again
+
+    def _cached(self, key: tuple) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, keys: Sequence[tuple], scores: Sequence[float]):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, question: str, ids: Sequence[str], texts: Sequence[str],
+              deadline: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Cross-encoder logits for each (question, text), or None if `deadline`
+        (a time.monotonic() value) passed before all of them were scored.
+        Batches scored before the deadline are cached either way. With a
+        deadline, a model that is not loaded yet counts as no budget left:
+        its load is started in the background rather than waited for.
+        """
+        qkey = question_key(question)
+        keys = [(qkey, doc_id) for doc_id in ids]
+        scores = [self._cached(k) for k in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing and deadline is not None and not self.loaded:
+            self.load_in_background()
+            return None
+
+        for start in range(0, len(missing), self.batch_size):
+            model = self.model
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            rows = missing[start:start + self.batch_size]
+            logits = model.predict([(question, texts[i] or "") for i in rows], batch_size=self.batch_size)
+            batch = [float(x) for x in logits]
+            self._store([keys[i] for i in rows], batch)
+            for i, s in zip(rows, batch):
+                scores[i] = s
+        return scores
+
+
+_reranker = None
+
+
+def get_reranker() -> Reranker:
+    global _reranker
+    if _reranker is None:
+        _reranker = Reranker()
+    return _reranker
@@ -1,28 +1,373 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
 
-_client = chromadb.PersistentClient(path="vectordb")
-_collection = _client.get_or_create_collection(name="advisor_memory")
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+VECTORDB_PATH = os.getenv("ADVISOR_VECTORDB_PATH", "vectordb")
+COLLECTION_NAME = "advisor_memory"
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# When set, the model and the Chroma index live in a separate
+# `python -m intelligence.embedding_service` process and every call below
+# goes over this Unix socket instead of loading torch in this process.
+EMBED_SOCKET = os.getenv("ADVISOR_EMBED_SOCKET")
+
+# When set, each firm's documents go to their own collection
+# (advisor_memory__<firm>) and searches only touch the shards they need.
+SHARD_BY_FIRM = os.getenv("ADVISOR_SHARD_BY_FIRM", "").lower() in ("1", "true", "yes")
+DEFAULT_FIRM = "default"
+# how long a generation's list of firm shards is reused before re-listing
+SHARD_LIST_TTL = 30.0
+# firm recorded on documents that don't name their own (see document_firm)
+FIRM = os.getenv("ADVISOR_FIRM")
+
+
+def date_key(value):
+    """YYYYMMDD int for a date/datetime/ISO string, so date ranges can be filtered on."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def document_firm(firm: Optional[str] = None) -> str:
+    """
+    The firm to index a document under: the one its text or CRM record names,
+    else ADVISOR_FIRM, else DEFAULT_FIRM. Every document gets one, so a firm
+    filter and the firm shards always agree.
+    """
+    return (firm or "").strip() or FIRM or DEFAULT_FIRM
+
+
+def clean_metadata(metadata: dict) -> dict:
+    """Chroma rejects None values; dates are stored as date_key ints."""
+    out = {}
+    for k, v in metadata.items():
+        if v is None:
+            continue
+        if isinstance(v, (date, datetime)):
+            v = date_key(v)
+        out[k] = v
+    return out
+
+
+def build_where(client_id=None, source=None, advisor=None, firm=None,
+                date_from=None, date_to=None):
+    """Chroma `where` clause for the supported filters, or None for no filter."""
+    clauses = []
+    for key, value in (("client_id", client_id), ("source", source),
+                       ("advisor", advisor), ("firm", firm)):
+        if value:
+            clauses.append({key: {"$eq": value}})
+    if date_from:
+        clauses.append({"doc_date": {"$gte": date_key(date_from)}})
+    if date_to:
+        clauses.append({"doc_date": {"$lte": date_key(date_to)}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def shard_name(firm) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", (firm or DEFAULT_FIRM).lower()).strip("_")
+    return f"{COLLECTION_NAME}__{slug or DEFAULT_FIRM}"
+
+
+def _merge_results(parts, n_results: int):
+    """Merge per-shard results for the same queries, nearest first."""
+    keys = ("ids", "distances", "metadatas", "documents")
+    n_queries = len(parts[0]["ids"]) if parts else 0
+    merged = {k: [] for k in keys}
+    for qi in range(n_queries):
+        hits = []
+        for p in parts:
+            for j, d in enumerate((p.get("distances") or [[]] * n_queries)[qi]):
+                hits.append((d, p, j))
+        hits.sort(key=lambda h: h[0])
+        for k in keys:
+            merged[k].append([
+                p[k][qi][j] if p.get(k) else None
+                for _, p, j in hits[:n_results]
+            ])
+    return merged
+
+
+def generations_dir(base: str = VECTORDB_PATH) -> Path:
+    """Where intelligence.index_builder puts index generations for `base`."""
+    b = Path(base)
+    return b.with_name(b.name + ".generations")
+
+
+def pointer_path(base: str = VECTORDB_PATH) -> Path:
+    """JSON file naming the live generation ({"current": ..., "previous": ...})."""
+    b = Path(base)
+    return b.with_name(b.name + ".current")
+
+
+def read_pointer(base: str = VECTORDB_PATH) -> dict:
+    try:
+        return json.loads(pointer_path(base).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def resolve_index_path(base: str = VECTORDB_PATH) -> str:
+    """The live Chroma directory: the current generation if one is set, else `base`."""
+    current = read_pointer(base).get("current")
+    return str(generations_dir(base) / current) if current else str(base)
+
+
+class _Generation:
+    """One Chroma directory and the collections opened from it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._client = None
+        self._collections = {}
+        self._shard_names = {}      # collection name -> (shard names, listed at)
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def collection(self, name: str):
+        col = self._collections.get(name)
+        if col is None:
+            col = self.client.get_or_create_collection(name=name)
+            with self._lock:
+                self._collections[name] = col
+                # a shard this process just created is searchable at once
+                for base, (names, listed_at) in self._shard_names.items():
+                    if name.startswith(base + "__") and name not in names:
+                        self._shard_names[base] = (sorted(names + [name]), listed_at)
+        return col
+
+    def shards(self, collection_name: str, shard_by_firm: bool):
+        if not shard_by_firm:
+            return [self.collection(collection_name)]
+        cached = self._shard_names.get(collection_name)
+        if cached is None or time.monotonic() - cached[1] > SHARD_LIST_TTL:
+            # listing collections is a round trip to Chroma's sysdb; only
+            # redo it now and then to see shards other processes created
+            prefix = collection_name + "__"
+            names = []
+            for c in self.client.list_collections():
+                name = c if isinstance(c, str) else c.name
+                if name.startswith(prefix):
+                    names.append(name)
+            cached = (sorted(names), time.monotonic())
+            with self._lock:
+                self._shard_names[collection_name] = cached
+        return [self.collection(n) for n in cached[0]]
+
+
+class LocalIndex:
+    """
+    The sentence-transformer model and Chroma collection(s), loaded on first use.
+
+    With the default path the index follows the generation pointer written by
+    `python -m intelligence.index_builder`: when it is repointed, new calls
+    open the new generation while calls already running finish on the old one.
+    An explicit path pins the index to that directory.
+    """
+
+    def __init__(self, path: Optional[str] = None, collection_name: str = COLLECTION_NAME,
+                 model_name: str = MODEL_NAME, shard_by_firm: bool = SHARD_BY_FIRM,
+                 base_path: str = VECTORDB_PATH):
+        self.pinned_path = path
+        self.base_path = base_path
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.shard_by_firm = shard_by_firm
+        self._model = None
+        self._generation = None
+        self._pointer_stat = None
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _current(self) -> _Generation:
+        """The live generation; re-reads the pointer only when it changed on disk."""
+        if self.pinned_path is not None:
+            if self._generation is None:
+                self._generation = _Generation(self.pinned_path)
+            return self._generation
+
+        try:
+            st = pointer_path(self.base_path).stat()
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            stamp = None
+        gen = self._generation
+        if gen is None or stamp != self._pointer_stat:
+            with self._lock:
+                path = resolve_index_path(self.base_path)
+                if self._generation is None or self._generation.path != path:
+                    self._generation = _Generation(path)
+                self._pointer_stat = stamp
+                gen = self._generation
+        return gen
+
+    @property
+    def path(self) -> str:
+        return self._current().path
+
+    @property
+    def client(self):
+        return self._current().client
+
+    @property
+    def collection(self):
+        return self._current().collection(self.collection_name)
+
+    def shards(self):
+        """Every collection a search may need to touch."""
+        return self._current().shards(self.collection_name, self.shard_by_firm)
+
+    def encode(self, texts):
+        """float32 array of shape (len(texts), dim)."""
+        return self.model.encode(list(texts), convert_to_numpy=True).astype("float32", copy=False)
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        self._write("add", ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids, documents, metadatas, embeddings=None):
+        """Like add, but ids that already exist are overwritten instead of rejected."""
+        self._write("upsert", ids, documents, metadatas, embeddings)
+
+    def _write(self, method: str, ids, documents, metadatas, embeddings):
+        if embeddings is None:
+            embeddings = self.encode(documents)
+        metadatas = [clean_metadata(m) for m in metadatas]
+        gen = self._current()
+
+        batches = {}
+        for i, m in enumerate(metadatas):
+            name = shard_name(m.get("firm")) if self.shard_by_firm else self.collection_name
+            batches.setdefault(name, []).append(i)
+
+        for name, rows in batches.items():
+            getattr(gen.collection(name), method)(
+                ids=[ids[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                embeddings=[list(map(float, embeddings[i])) for i in rows],
+            )
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 3,
+              where=None, firms=None):
+        """
+        Nearest documents per query. `where` is pushed down into Chroma.
+        With firm sharding, `firms` limits the search to those firms' shards;
+        otherwise every shard is searched in parallel and merged by distance.
+        """
+        if query_embeddings is None:
+            query_embeddings = self.encode(query_texts)
+        embeddings = [list(map(float, e)) for e in query_embeddings]
+        # resolved once, so a repoint mid-query can't mix generations
+        gen = self._current()
+
+        if firms and self.shard_by_firm:
+            wanted = {shard_name(f) for f in firms}
+            shards = [s for s in gen.shards(self.collection_name, True) if s.name in wanted]
+        else:
+            shards = gen.shards(self.collection_name, self.shard_by_firm)
+            if firms:
+                firm_clause = {"firm": {"$in": list(firms)}}
+                where = {"$and": [where, firm_clause]} if where else firm_clause
+
+        def run(col):
+            return col.query(query_embeddings=embeddings, n_results=n_results, where=where)
+
+        if not shards:
+            empty = [[] for _ in embeddings]
+            return {"ids": empty, "distances": empty, "metadatas": empty, "documents": empty}
+        if len(shards) == 1:
+            return run(shards[0])
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-query")
+        return _merge_results(list(self._pool.map(run, shards)), n_results)
+
+    def count(self) -> int:
+        return sum(c.count() for c in self.shards())
+
+
+_local = LocalIndex()
+_remote = None
+
+
+def get_index():
+    """LocalIndex, or a client for the shared embedding service if configured."""
+    global _remote
+    if not EMBED_SOCKET:
+        return _local
+    if _remote is None:
+        from intelligence.embedding_service import EmbeddingClient
+        _remote = EmbeddingClient(EMBED_SOCKET)
+    return _remote
 
 
 def add_text(doc_id: str, text: str, metadata: dict):
-    embedding = _model.encode(text).tolist()
-    _collection.add(
-        ids=[doc_id],
-        documents=[text],
-        metadatas=[metadata],
-        embeddings=[embedding],
-    )
+    add_texts([doc_id], [text], [metadata])
+
+
+def add_texts(ids, texts, metadatas):
+    get_index().add(ids, texts, metadatas)
+
+
+def upsert_texts(ids, texts, metadatas, embeddings=None):
+    get_index().upsert(ids, texts, metadatas, embeddings)
+
+
+def query(question: str, n_results: int = 3, where=None, firms=None):
+    return query_many([question], n_results=n_results, where=where, firms=firms)
+
+
+def query_many(questions, n_results: int = 3, where=None, firms=None):
+    """One batched encode and one multi-embedding query for all questions."""
+    return get_index().query(query_texts=list(questions), n_results=n_results,
+                             where=where, firms=firms)
+
+
+def encode(texts):
+    return get_index().encode(list(texts))
 
 
-def query(question: str, n_results: int = 3):
-    embedding = _model.encode(question).tolist()
-    return _collection.query(
-        query_embeddings=[embedding],
-        n_results=n_results,
-    )
+def query_embeddings(embeddings, n_results: int = 3, where=None, firms=None):
+    """Query with already-encoded questions (e.g. to re-query without re-encoding)."""
+    return get_index().query(query_embeddings=embeddings, n_results=n_results,
+                             where=where, firms=firms)
 
 
 def get_db():
-    return _collection
+    index = get_index()
+    return index.collection if index is _local else index
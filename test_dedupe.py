@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+from ingestion.dedupe import MinHasher, dedupe_docs, duplicate_clusters
+
+FACT_FIND = (
+    "Client Name: Sarah Thompson. Sarah is 52 and wants to retire at 60. "
+    "She holds a SIPP with Aviva and a workplace pension with Scottish Widows, "
+    "and has used 5000 of this year's ISA allowance."
+)
+
+
+def test_blank_documents_are_not_duplicates():
+    docs = [
+        {"file_name": "a.docx", "text": ""},
+        {"file_name": "b.docx", "text": "  \n "},
+        {"file_name": "c.docx", "text": "hello"},
+        {"file_name": "d.docx", "text": "hello"},
+    ]
+    kept, duplicates = dedupe_docs(docs)
+    assert [d["file_name"] for d in kept] == ["a.docx", "b.docx", "c.docx", "d.docx"]
+    assert duplicates == {}
+
+
+def test_near_duplicate_copies_collapse():
+    docs = [
+        {"file_name": "Sarah Thompson FactFind .docx", "text": FACT_FIND},
+        {"file_name": "Sarah Thompson.docx", "text": FACT_FIND + " "},
+        {"file_name": "empty.docx", "text": ""},
+    ]
+    kept, duplicates = dedupe_docs(docs)
+    assert [d["file_name"] for d in kept] == ["Sarah Thompson FactFind .docx", "empty.docx"]
+    assert duplicates == {"Sarah Thompson FactFind .docx": ["Sarah Thompson.docx"]}
+    assert duplicate_clusters(["", FACT_FIND, " ", FACT_FIND]) == [[1, 3]]
+
+
+def test_earliest_copy_stays_canonical(tmp_path):
+    first, later = tmp_path / "Sarah Thompson.docx", tmp_path / "A Sarah Thompson.docx"
+    for path, mtime in ((first, 1_000_000), (later, 2_000_000)):
+        path.write_bytes(b"")
+        os.utime(path, (mtime, mtime))
+    docs = [
+        {"file_name": later.name, "file_path": str(later), "text": FACT_FIND + " Reviewed again."},
+        {"file_name": first.name, "file_path": str(first), "text": FACT_FIND},
+    ]
+    kept, duplicates = dedupe_docs(docs)
+    assert [d["file_name"] for d in kept] == ["Sarah Thompson.docx"]
+    assert duplicates == {"Sarah Thompson.docx": ["A Sarah Thompson.docx"]}
+
+
+class FixedHasher(MinHasher):
+    def __init__(self, sigs):
+        self.num_perm = sigs.shape[1]
+        self.sigs = sigs
+
+    def signatures(self, texts):
+        return self.sigs[:len(texts)]
+
+
+def test_bucket_members_are_all_compared():
+    # all three share the first band's bucket; only 1 and 2 are near-identical
+    sigs = np.zeros((3, 128), dtype=np.uint64)
+    sigs[0, 64:] = 7
+    sigs[1, 64:] = np.arange(64)
+    sigs[2, 64:] = np.arange(64)
+    sigs[2, 127] = 99
+    texts = [FACT_FIND] * 3
+    assert duplicate_clusters(texts, bands=2, hasher=FixedHasher(sigs)) == [[1, 2]]
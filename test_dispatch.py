@@ -0,0 +1,147 @@
+import asyncio
+import smtplib
+from datetime import date, timedelta
+
+from chaser.dispatch import ChannelAdapter, ContactBook, SentLedger, SmtpAdapter, coalesce, dispatch_chases
+from core.task_table import TaskTable
+
+OVERDUE = (date.today() - timedelta(days=10)).isoformat()
+
+
+def task(client_id, client_name, item_name, target, provider=None):
+    return {
+        "client_id": client_id,
+        "client_name": client_name,
+        "item_name": item_name,
+        "required_for": "advice",
+        "target": target,
+        "provider": provider,
+        "status": "not_started",
+        "priority": "high",
+        "channel": "email",
+        "due_date": OVERDUE,
+        "reason": "needed for suitability work",
+        "source_doc": f"{client_id}.docx",
+    }
+
+
+BOOK = [
+    task("C1", "Sarah Thompson", "pension_transfer_value", "provider", "aviva"),
+    task("C1", "Sarah Thompson", "pension_exit_penalties", "provider", "aviva"),
+    task("C2", "David Chen", "pension_transfer_value", "provider", "aviva"),
+    task("C2", "David Chen", "collect_risk_profile", "client"),
+]
+
+CONTACTS = ContactBook({
+    "provider": {"Aviva": {"email": "pensions@aviva.example"}},
+    "client": {"C1": {"email": "sarah@example.com"}, "C2": {"email": "david@example.com"}},
+})
+
+
+class RecordingAdapter(ChannelAdapter):
+    channel = "email"
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+def test_clients_sharing_a_provider_get_one_message():
+    messages = coalesce(TaskTable.from_dicts(BOOK))
+    to_provider = [m for m in messages if m.target == "provider"]
+    assert len(to_provider) == 1
+    assert to_provider[0].client_ids == ["C1", "C2"]
+    assert len(to_provider[0].tasks) == 3
+    assert CONTACTS.address(to_provider[0]) == "pensions@aviva.example"
+
+
+def test_repeated_dispatch_does_not_resend(tmp_path):
+    ledger = tmp_path / "chase_sent.json"
+    table = TaskTable.from_dicts(BOOK)
+    adapter = RecordingAdapter()
+
+    first = asyncio.run(dispatch_chases(table, [adapter], CONTACTS, ledger_path=ledger))
+    assert sorted(r["status"] for r in first) == ["sent", "sent"]
+    again = asyncio.run(dispatch_chases(table, [adapter], CONTACTS, ledger_path=ledger))
+    assert again == []
+    assert len(adapter.sent) == 2
+
+    advanced = SentLedger.load(ledger).apply(table)
+    assert set(advanced.values("status")) == {"escalated"}
+
+
+class RejectingSmtp(SmtpAdapter):
+    backoff = 0.0
+
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+        self.calls = 0
+
+    def _send_sync(self, message):
+        self.calls += 1
+        raise self.error
+
+
+def test_permanent_smtp_errors_are_not_retried(tmp_path):
+    table = TaskTable.from_dicts(BOOK[3:])
+    for error, calls in (
+        (smtplib.SMTPRecipientsRefused({"david@example.com": (550, b"no such user")}), 1),
+        (smtplib.SMTPResponseException(451, b"try again later"), SmtpAdapter.max_attempts),
+    ):
+        adapter = RejectingSmtp(error)
+        [result] = asyncio.run(dispatch_chases(table, [adapter], CONTACTS, ledger_path=tmp_path / "sent.json"))
+        assert result["status"] == "failed"
+        assert adapter.calls == calls
+
+
+class SlowAdapter(RecordingAdapter):
+    def __init__(self, delay, hang_after=None):
+        super().__init__()
+        self.delay = delay
+        self.hang_after = hang_after
+
+    async def send(self, message):
+        if self.hang_after is not None and len(self.sent) >= self.hang_after:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+
+def test_concurrent_dispatches_share_the_ledger(tmp_path):
+    ledger = tmp_path / "chase_sent.json"
+    table = TaskTable.from_dicts(BOOK)
+    adapter = SlowAdapter(0.1)
+
+    async def both():
+        return await asyncio.wait_for(asyncio.gather(
+            dispatch_chases(table, [adapter], CONTACTS, ledger_path=ledger),
+            dispatch_chases(table, [adapter], CONTACTS, ledger_path=ledger),
+        ), timeout=5)
+
+    first, second = asyncio.run(both())
+    assert sorted(r["status"] for r in first + second) == ["sent", "sent"]
+    assert len(adapter.sent) == 2
+
+
+def test_cancelled_dispatch_records_what_was_sent(tmp_path):
+    ledger = tmp_path / "chase_sent.json"
+    table = TaskTable.from_dicts(BOOK)
+    adapter = SlowAdapter(0.0, hang_after=1)
+    adapter.concurrency = 1
+
+    async def cancelled():
+        task = asyncio.ensure_future(dispatch_chases(table, [adapter], CONTACTS, ledger_path=ledger))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancelled())
+    assert len(adapter.sent) == 1
+    recorded = {key[0] for key in SentLedger.load(ledger).entries}
+    assert recorded == set(adapter.sent[0].client_ids)
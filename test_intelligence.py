@@ -1,4 +1,5 @@
-from intelligence.query_engine import ask
+from intelligence.query_engine import QueryEngine
+from intelligence.vector_store import get_db
 
 questions = [
     "Which clients are worried about market volatility?",
@@ -6,9 +7,16 @@ questions = [
     "Which clients mentioned pension fees?"
 ]
 
+engine = QueryEngine(get_db())
+
 for q in questions:
     print("\n🔍 QUESTION:", q)
-    results = ask(q)
+    results = engine.ask(q)["results"]
 
     for r in results:
         print("➡", r["client"])
+
+# same questions, one encode + one index query
+answers = engine.ask_batch([(q, 5) for q in questions])
+for q, answer in zip(questions, answers):
+    assert answer == engine.ask(q), q
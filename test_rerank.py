@@ -0,0 +1,71 @@
+import threading
+import time
+
+import intelligence.query_engine as qe
+from intelligence.query_engine import QueryEngine
+from intelligence.reranker import Reranker
+
+
+class StubReranker:
+    candidates = 2
+
+    def __init__(self, logits):
+        self.logits = logits
+
+    def score(self, question, ids, texts, deadline=None):
+        return [self.logits[i] for i in ids]
+
+
+def hits(*rows):
+    """Index results for one query from (id, client, distance) rows."""
+    return {
+        "ids": [[r[0] for r in rows]],
+        "distances": [[r[2] for r in rows]],
+        "metadatas": [[{"client_name": r[1], "source": f"{r[0]}.docx"} for r in rows]],
+        "documents": [[f"text of {r[0]}" for r in rows]],
+    }
+
+
+def test_reranked_clients_rank_ahead_of_the_tail_under_sum(monkeypatch):
+    # two shortlisted hits, then many close hits for a client the reranker never saw
+    rows = [("a1", "Alice", 0.4), ("b1", "Bob", 0.5)]
+    rows += [(f"c{i}", "Carol", 0.6) for i in range(8)]
+    monkeypatch.setattr(qe, "vs_encode", lambda texts: [[0.0] for _ in texts])
+    monkeypatch.setattr(qe, "vs_query_embeddings", lambda embeddings, **kw: hits(*rows))
+
+    engine = QueryEngine(None, reranker=StubReranker({"a1": -1.0, "b1": 3.0}))
+    for aggregate in ("sum", "max"):
+        answer = engine.ask("pension transfer", top_k=3, aggregate=aggregate, rerank=True)
+        assert answer["reranked"] is True
+        assert [r["client"] for r in answer["results"]] == ["Bob", "Alice", "Carol"]
+        assert answer["results"][2]["score"] == 0.0
+
+
+class SlowLoadingReranker(Reranker):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.release.wait(5)
+            self._model = FixedModel()
+        return self._model
+
+
+class FixedModel:
+    def predict(self, pairs, batch_size=None):
+        return [float(len(text)) for _, text in pairs]
+
+
+def test_cold_model_counts_as_out_of_budget():
+    reranker = SlowLoadingReranker()
+    started = time.monotonic()
+    assert reranker.score("q", ["a", "b"], ["x", "yy"], deadline=started + 10) is None
+    assert time.monotonic() - started < 1
+
+    reranker.release.set()
+    reranker._loader.join(5)
+    assert reranker.loaded
+    assert reranker.score("q", ["a", "b"], ["x", "yy"], deadline=time.monotonic() + 10) == [1.0, 2.0]